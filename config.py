@@ -55,14 +55,58 @@ PSW_SALT = 'your PSW SALT'
 TOKEN_DURATION = 7200  # in second
 ACCESS_TOKEN_EXPIRATION = 3600  # in second
 REFRESH_TOKEN_EXPIRATION = 86400  # in second
+# max number of verified tokens kept in memory, 0 to disable
+AUTH_TOKEN_CACHE_SIZE = 1024
+# how long a verified token is trusted without checking its signature
+AUTH_TOKEN_CACHE_TTL = 60  # in second
+# max number of valid users kept in memory, 0 to disable
+AUTH_USER_CACHE_SIZE = 1024
+# how long a valid user is trusted without reading the db
+AUTH_USER_CACHE_TTL = 60  # in second
 # root user default setting
 DEFAULT_ROOT_USERNAME = 'admin'
 DEFAULT_ROOT_PASSWORD = 'admin'
 
+"""
+    eater configuration
+"""
+# number of records written (and committed) at a time by bulk upsert
+EATER_BULK_CHUNK = 1000
+# max number of decrypted passwords kept in memory, 0 to disable
+EATER_DECRYPT_CACHE_SIZE = 0
+# how long a decrypted password is kept in memory
+EATER_DECRYPT_CACHE_TTL = 300  # in second
+
 """
     walker configuration
 """
 WALKER_MISSION_TIMEOUT = 180  # in second
+# max number of walkers running at the same time, the others are queued
+WALKER_MAX_RUNNING = 4
+# number of trails written at a time by one executemany
+WALKER_BULK_CHUNK = 1000
+# outputs longer than this are compressed into the output store,
+# and their owners keep this much of their heads as summaries
+WALKER_OUTPUT_SUMMARY = 1024  # in characters
+# ansible parallel connections of a walker by default, and the max allowed
+ANSIBLE_FORKS = 5
+ANSIBLE_MAX_FORKS = 50
+# ansible runs hosts of a walker in batches of this size, 0 for one batch
+ANSIBLE_SERIAL = 0
+# ansible ssh connection timeout by default
+ANSIBLE_SSH_TIMEOUT = 10  # in second
+# ssh master connections of (host, port, user, key) are kept for reuse
+# this long after their last use, 0 to disable. when enabled, Control*
+# options of ssh_args in ansible.cfg are dropped in favour of these
+ANSIBLE_SSH_PERSIST = 300  # in second
+ANSIBLE_SSH_CONTROL_DIR = os.path.join(basedir, '.ssh_control')
+# run modules through the ssh session instead of copying them first,
+# only turn it on when 'requiretty' is off in the sudoers of all hosts
+ANSIBLE_SSH_PIPELINING = False
+# scripts run by walkers are cached here, named after their content digest
+WALKER_SCRIPT_CACHE = os.path.join(basedir, '.script_cache')
+# cached scripts unused this long are removed, 0 to keep them forever
+WALKER_SCRIPT_CACHE_AGE = 86400  # in second
 ROOT_SSH_KEY_FILE = os.path.join(basedir, '.ssh_key/root_id_rsa')
 ADMIN_SSH_KEY_FILE = os.path.join(basedir, '.ssh_key/admin_id_rsa')
 
@@ -85,6 +129,18 @@ DEFAULT_ZABBIX_URL = 'http://192.168.182.150/zabbix'
 # zabbix user info
 DEFAULT_ZABBIX_USER_NAME = 'cloudlab'
 DEFAULT_ZABBIX_PASSWORD = 'cloudlab'
+# keep-alive connections kept to zabbix
+ZABBIX_POOL_SIZE = 10
+# timeouts of connecting to zabbix and of waiting for its response
+ZABBIX_CONNECT_TIMEOUT = 3  # in second
+ZABBIX_READ_TIMEOUT = 30  # in second
+# max number of zabber list results kept in memory, 0 to disable
+ZABBER_CACHE_SIZE = 256
+# how long zabber list results are served from memory
+ZABBER_CACHE_TTL = 60  # in second
+# serve results expired for less than this while they are refreshed
+# in the background, 0 to wait for the refresh
+ZABBER_CACHE_STALE = 0  # in second
 
 """
     celery configuration
@@ -7,14 +7,30 @@
 # this is the ansible driver module, called by promise.walker
 
 import os
-from tempfile import NamedTemporaryFile
+import shlex
+import pipes
+import hashlib
+import time
+import errno
+import socket
+import tempfile
+import threading
+import uuid
 from ansible.inventory import Inventory
+from ansible.inventory.group import Group
+from ansible.inventory.host import Host
+from ansible.parsing.utils.addresses import parse_address
 from ansible.vars import VariableManager
 from ansible.parsing.dataloader import DataLoader
 # from ansible.executor import playbook_executor
 from ansible.utils.display import Display
 from ansible.executor.task_queue_manager import TaskQueueManager
 from ansible.playbook.play import Play
+from ansible.playbook.play_context import PlayContext
+from ansible.plugins import module_loader, action_loader, \
+    connection_loader, shell_loader, strategy_loader, callback_loader, \
+    filter_loader, test_loader, lookup_loader
+from .callback.callback import CallbackModule
 
 
 class Options(object):
@@ -80,14 +96,272 @@ class Options(object):
         self.module_path = module_path
 
 
+def runInBatches(tqm, inventory, play, serial=None):
+    """
+    run the play on batches of at most 'serial' hosts one after another,
+    as TaskQueueManager leaves the 'serial' keyword of a play to
+    PlaybookExecutor. the code of the first batch gone wrong is returned,
+    the codes of TaskQueueManager are not flags to be combined.
+    """
+    # the callback loader of ansible is not safe to be run by walkers
+    # at the same time, so callbacks are loaded one play after another
+    with runtime.lock:
+        tqm.load_callbacks()
+    hosts = inventory.get_hosts(play.hosts)
+    if not serial or serial >= len(hosts):
+        return tqm.run(play)
+    state = 0
+    try:
+        for i in range(0, len(hosts), serial):
+            inventory.restrict_to_hosts(hosts[i:i + serial])
+            result = tqm.run(play)
+            if result and not state:
+                state = result
+    finally:
+        inventory.remove_restriction()
+    return state
+
+
+class AnsibleRuntime(object):
+    """
+    ansible objects shared by all the walkers of the process.
+    the loader and display are built once, and the plugins walkers use
+    are found and imported once, before the first play is run.
+    as ansible forks a worker for every task of every host,
+    the workers get the warm plugin caches from this process for free.
+    """
+    # plugins a walker play needs
+    modules = ('shell', 'command', 'script')
+    connections = ('ssh', 'paramiko_ssh', 'local')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.warmed = False
+        # when stale ssh control sockets were cleaned up last
+        self.cleaned = 0
+        # when unused cached scripts were cleaned up last
+        self.scripts_cleaned = 0
+        # whether Control* options are dropped from ssh_args of ansible.cfg
+        self.control_dropped = False
+        # Gets data from YAML/JSON files
+        self.loader = DataLoader()
+        # self.loader.set_vault_password(os.environ['VAULT_PASS'])
+        # the display is shared by all the walkers, so is its verbosity,
+        # which is set once here
+        self.display = Display()
+        self.display.verbosity = 0
+
+    def warm(self):
+        with self.lock:
+            if self.warmed:
+                return
+            for name in self.modules:
+                module_loader.find_plugin(name)
+            action_loader.all(class_only=True)
+            for name in self.connections:
+                connection_loader.get(name, class_only=True)
+            shell_loader.all(class_only=True)
+            strategy_loader.get('linear', class_only=True)
+            callback_loader.all(class_only=True)
+            lookup_loader.all(class_only=True)
+            filter_loader.all()
+            test_loader.all()
+            self.warmed = True
+
+    def variableManager(self, run_data):
+        # All the variables from all the various places
+        variable_manager = VariableManager()
+        variable_manager.extra_vars = run_data
+        return variable_manager
+
+    def connectionVars(self, private_key_file=None, control_dir=None,
+                       persist=0, pipelining=False):
+        """
+        play variables of ssh connections. with persist, a master connection
+        per (host, port, user, key) is kept for persist seconds after its
+        last use, so later walkers on the same host skip the ssh handshake.
+        pipelining is only set when asked for, or ansible.cfg decides.
+        """
+        variables = dict()
+        if pipelining:
+            variables['ansible_ssh_pipelining'] = True
+        if not persist or not control_dir:
+            return variables
+        self.dropControlArgs()
+        key = os.path.abspath(os.path.expanduser(
+            private_key_file or '~/.ssh/id_rsa'))
+        directory = os.path.join(
+            control_dir, hashlib.sha1(key).hexdigest()[:10])
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory, 0o700)
+            except OSError:
+                # made by another walker in the meantime
+                if not os.path.isdir(directory):
+                    raise
+        self.cleanSockets(control_dir, persist)
+        variables['ansible_ssh_common_args'] = (
+            '-o ControlMaster=auto -o ControlPersist=%ds '
+            '-o ControlPath=%s/%%h-%%p-%%r' % (persist, directory))
+        return variables
+
+    def dropControlArgs(self):
+        # ssh takes the first value of an option, and ssh_args of ansible.cfg
+        # go before the play's, so Control* options are dropped from them
+        # for those of the walkers to take effect
+        with self.lock:
+            if self.control_dropped:
+                return
+            args = []
+            words = iter(shlex.split(PlayContext._ssh_args.default or ''))
+            for word in words:
+                arg = [word]
+                if word == '-o':
+                    arg.append(next(words, ''))
+                if not ''.join(arg).lower().startswith('-ocontrol'):
+                    args.extend(arg)
+            PlayContext._ssh_args.default = ' '.join(
+                pipes.quote(x) for x in args)
+            self.control_dropped = True
+
+    def cleanSockets(self, control_dir, persist):
+        # remove sockets left by masters which are gone,
+        # at most once per persist period
+        now = time.time()
+        with self.lock:
+            if now - self.cleaned < persist:
+                return
+            self.cleaned = now
+        for root, dirs, files in os.walk(control_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                sock = socket.socket(socket.AF_UNIX)
+                try:
+                    if now - os.lstat(path).st_mtime < persist:
+                        continue
+                    sock.connect(path)
+                except (socket.error, OSError) as e:
+                    if e.errno in (errno.ECONNREFUSED, errno.ENOTSOCK):
+                        try:
+                            os.remove(path)
+                        except OSError:
+                            pass
+                finally:
+                    sock.close()
+
+    def cleanScripts(self, cache_dir, max_age):
+        # remove cached scripts unused for max_age seconds,
+        # at most once per max_age period
+        now = time.time()
+        with self.lock:
+            if now - self.scripts_cleaned < max_age:
+                return
+            self.scripts_cleaned = now
+        for name in os.listdir(cache_dir):
+            path = os.path.join(cache_dir, name)
+            try:
+                if now - os.stat(path).st_mtime < max_age:
+                    continue
+                # scripts are marked used under the lock, look again there
+                with self.lock:
+                    if time.time() - os.stat(path).st_mtime >= max_age:
+                        os.remove(path)
+            except OSError:
+                pass
+
+
+runtime = AnsibleRuntime()
+
+
+def buildInventory(loader, variable_manager, hostnames, host_vars=None,
+                   group_name='run_hosts'):
+    """
+    build the inventory in memory, with a group of the hostnames.
+    ansible caches hosts of a pattern process-wide, so a play running
+    while other walkers' do has to name its hosts by a group of its own.
+    a hostname may carry variables as in a hosts file,
+    like '10.0.0.1 ansible_port=2222', host_vars are set on top of them.
+    """
+    inventory = Inventory(
+        loader=loader, variable_manager=variable_manager, host_list=[])
+    group = Group(group_name)
+    inventory.add_group(group)
+    inventory.get_group('all').add_child_group(group)
+    hosts = dict()
+    for hostname in hostnames:
+        fields = shlex.split(hostname)
+        (name, port) = parse_address(fields[0])
+        if name not in hosts:
+            hosts[name] = Host(name, port)
+            group.add_host(hosts[name])
+        for field in fields[1:]:
+            (key, value) = field.split('=', 1)
+            hosts[name].set_variable(key, value)
+    for name, variables in (host_vars or {}).items():
+        if name in hosts:
+            for key, value in variables.items():
+                hosts[name].set_variable(key, value)
+    inventory.clear_pattern_cache()
+    variable_manager.set_inventory(inventory)
+    return inventory
+
+
+def groupName(run_data):
+    # the group of hosts of a walker
+    return 'walker_%s' % (run_data.get('walker_id') or uuid.uuid4().hex)
+
+
+def scriptFile(script_text, cache_dir=None, max_age=0):
+    """
+    path of the script file named after the digest of its content,
+    the file is written only if the same script has not been cached yet.
+    with max_age, cached scripts unused for max_age seconds are removed.
+    """
+    cache_dir = cache_dir or os.path.join(
+        tempfile.gettempdir(), 'promise_scripts')
+    if not os.path.isdir(cache_dir):
+        try:
+            os.makedirs(cache_dir)
+        except OSError:
+            # made by another walker in the meantime
+            if not os.path.isdir(cache_dir):
+                raise
+    if max_age:
+        runtime.cleanScripts(cache_dir, max_age)
+    content = script_text.encode('utf-8')
+    path = os.path.join(cache_dir, hashlib.sha1(content).hexdigest())
+    # not to be removed by cleanScripts between marked and returned
+    with runtime.lock:
+        try:
+            # mark the script used
+            os.utime(path, None)
+        except OSError:
+            # write aside then rename, so a script is never seen half written
+            (fd, tmp) = tempfile.mkstemp(dir=cache_dir)
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    f.write(content)
+                os.rename(tmp, path)
+            except Exception:
+                os.remove(tmp)
+                raise
+    return path
+
+
 class ShellExecAdapter(object):
 
     def __init__(self, hostnames, remote_user, private_key_file,
-                 run_data, become_pass, shell, verbosity=0):
+                 run_data, become_pass, shell, verbosity=0,
+                 forks=None, serial=None, timeout=None, on_result=None,
+                 host_vars=None,
+                 control_dir=None, persist=0, pipelining=False):
 
         self.run_data = run_data
+        self.serial = serial
 
         self.options = Options()
+        self.options.forks = forks
+        self.options.timeout = timeout
         self.options.private_key_file = private_key_file
         self.options.verbosity = verbosity
         self.options.connection = 'ssh'
@@ -96,46 +370,28 @@ class ShellExecAdapter(object):
         self.options.become_method = 'sudo'
         self.options.become_user = 'root'
 
-        # Set global verbosity
-        self.display = Display()
-        self.display.verbosity = self.options.verbosity
+        # the loader, display and plugins are shared with other walkers
+        runtime.warm()
+        self.display = runtime.display
+        self.loader = runtime.loader
 
         # Become Pass Needed if not logging in as user root
         passwords = {'become_pass': become_pass}
 
-        # Gets data from YAML/JSON files
-        self.loader = DataLoader()
-        # self.loader.set_vault_password(os.environ['VAULT_PASS'])
+        self.variable_manager = runtime.variableManager(self.run_data)
 
-        # All the variables from all the various places
-        self.variable_manager = VariableManager()
-        self.variable_manager.extra_vars = self.run_data
-
-        # Parse hosts, I haven't found a good way to
-        # pass hosts in without using a parsed template
-        self.hosts = NamedTemporaryFile(delete=False)
-        hostsString = '\n'.join(hostnames)
-        self.hosts.write("""[run_hosts]\n%s""" % hostsString)
-        self.hosts.close()
-        # This was my attempt to pass in hosts directly.
-        #
-        # Also Note: In py2.7, "isinstance(foo, str)" is valid for
-        #            latin chars only. Luckily, hostnames are
-        #            ascii-only, which overlaps latin charset
-        # if isinstance(hostnames, str):
-        #     hostnames = {"customers": {"hosts": [hostnames]}}
-
-        # Set inventory, using most of above objects
-        self.inventory = Inventory(
-            loader=self.loader,
-            variable_manager=self.variable_manager,
-            host_list=self.hosts.name)
-        self.variable_manager.set_inventory(self.inventory)
+        # Set inventory in memory, no hosts file is written
+        self.hosts = groupName(run_data)
+        self.inventory = buildInventory(
+            self.loader, self.variable_manager, hostnames, host_vars,
+            self.hosts)
         play_source = dict(
             name="shell task",
             remote_user=remote_user,
-            hosts='all',
+            hosts=self.hosts,
             gather_facts='no',
+            vars=runtime.connectionVars(
+                private_key_file, control_dir, persist, pipelining),
             tasks=[
                 dict(shell=shell, args=dict(chdir='/tmp/'),
                      register='shell_out', no_log=True)])
@@ -147,17 +403,25 @@ class ShellExecAdapter(object):
         self.play = Play().load(
             play_source, variable_manager=self.variable_manager,
             loader=self.loader)
+        # results of hosts are handed over to on_result once they arrive
+        self.callback = CallbackModule(on_result)
         self.tqm = TaskQueueManager(
             inventory=self.inventory,
             variable_manager=self.variable_manager,
             loader=self.loader,
             options=self.options,
             passwords=passwords,
-            stdout_callback='default')
+            stdout_callback=self.callback)
+        self.callback.stats = self.tqm._stats
 
     def run(self):
         # Results of PlaybookExecutor
-        state = self.tqm.run(self.play)
+        try:
+            state = runInBatches(
+                self.tqm, self.inventory, self.play, self.serial)
+        finally:
+            self.tqm.cleanup()
+            self.inventory.clear_pattern_cache()
 
         hostvars = self.tqm.hostvars
         stats = self.tqm._stats
@@ -168,8 +432,9 @@ class ShellExecAdapter(object):
         for host in hosts:
             t = stats.summarize(host)
             stats_sum[host] = t
-            hostvar = hostvars.__getitem__(host)
-            results[host] = hostvar['shell_out']
+            if self.callback.on_result is None:
+                hostvar = hostvars.__getitem__(host)
+                results[host] = hostvar['shell_out']
 
 #        self.tqm.send_callback(
 #            'walker2ansibleLog',
@@ -177,21 +442,23 @@ class ShellExecAdapter(object):
 #            user_id=self.run_data['user_id'],
 #            run_success=run_success
 #        )
-        if self.tqm is not None:
-            self.tqm.cleanup()
-            os.remove(self.hosts.name)
-            self.inventory.clear_pattern_cache()
         return [state, stats_sum, results]
 
 
 class ScriptExecAdapter(object):
 
     def __init__(self, hostnames, remote_user, private_key_file,
-                 run_data, become_pass, script_text, params, verbosity=0):
+                 run_data, become_pass, script_text, params, verbosity=0,
+                 forks=None, serial=None, timeout=None, on_result=None,
+                 host_vars=None, script_cache=None, script_age=0,
+                 control_dir=None, persist=0, pipelining=False):
 
         self.run_data = run_data
+        self.serial = serial
 
         self.options = Options()
+        self.options.forks = forks
+        self.options.timeout = timeout
         self.options.private_key_file = private_key_file
         self.options.verbosity = verbosity
         self.options.connection = 'ssh'
@@ -200,78 +467,66 @@ class ScriptExecAdapter(object):
         self.options.become_method = 'sudo'
         self.options.become_user = 'root'
 
-        # Set global verbosity
-        self.display = Display()
-        self.display.verbosity = self.options.verbosity
+        # the loader, display and plugins are shared with other walkers
+        runtime.warm()
+        self.display = runtime.display
+        self.loader = runtime.loader
 
         # Become Pass Needed if not logging in as user root
         passwords = {'become_pass': become_pass}
 
-        # Gets data from YAML/JSON files
-        self.loader = DataLoader()
-        # self.loader.set_vault_password(os.environ['VAULT_PASS'])
+        self.variable_manager = runtime.variableManager(self.run_data)
 
-        # All the variables from all the various places
-        self.variable_manager = VariableManager()
-        self.variable_manager.extra_vars = self.run_data
-
-        # Parse hosts, I haven't found a good way to
-        # pass hosts in without using a parsed template
-        self.hosts_file = NamedTemporaryFile(delete=False)
-        hostsString = '\n'.join(hostnames)
-        self.hosts_file.write("""[run_hosts]\n%s""" % hostsString)
-        self.hosts_file.close()
-        self.script_file = NamedTemporaryFile(delete=False)
-        self.script_file.write("""%s""" % script_text.encode('utf-8'))
-        self.script_file.close()
-
-        # This was my attempt to pass in hosts directly.
-        #
-        # Also Note: In py2.7, "isinstance(foo, str)" is valid for
-        #            latin chars only. Luckily, hostnames are
-        #            ascii-only, which overlaps latin charset
-        # if isinstance(hostnames, str):
-        #     hostnames = {"customers": {"hosts": [hostnames]}}
-
-        # Set inventory, using most of above objects
-        self.inventory = Inventory(
-            loader=self.loader,
-            variable_manager=self.variable_manager,
-            host_list=self.hosts_file.name)
-        self.variable_manager.set_inventory(self.inventory)
+        # Set inventory in memory, no hosts file is written
+        self.hosts = groupName(run_data)
+        self.inventory = buildInventory(
+            self.loader, self.variable_manager, hostnames, host_vars,
+            self.hosts)
+        # the same script is written once and reused by later runs
+        self.script_file = scriptFile(script_text, script_cache, script_age)
         # file = open(self.script_file.name)
         # read=file.read()
         # print read
         play_source = dict(
             name="script task",
             remote_user=remote_user,
-            hosts='all',
+            hosts=self.hosts,
             gather_facts='no',
+            vars=runtime.connectionVars(
+                private_key_file, control_dir, persist, pipelining),
             tasks=[
                 dict(
-                    script=self.script_file.name + ' ' +
+                    script=self.script_file + ' ' +
                     params.encode('utf-8'),
                     register='script_out', no_log=True)])
 #            tasks=[
-#                dict(script=self.script_file.name + ' ' + str(params),
+#                dict(script=self.script_file + ' ' + str(params),
 #                     register='script_out', no_log=True),
 #                dict(action=dict(module='debug',
 #                     args=dict(msg='{{script_out.stdout}}')))])
         self.play = Play().load(
             play_source, variable_manager=self.variable_manager,
             loader=self.loader)
+        # results of hosts are handed over to on_result once they arrive
+        self.callback = CallbackModule(on_result)
         self.tqm = TaskQueueManager(
             inventory=self.inventory,
             variable_manager=self.variable_manager,
             loader=self.loader,
             options=self.options,
             passwords=passwords,
-            stdout_callback='default')
+            stdout_callback=self.callback)
+        self.callback.stats = self.tqm._stats
         print play_source
 
     def run(self):
         # Results of PlaybookExecutor
-        state = self.tqm.run(self.play)
+        try:
+            state = runInBatches(
+                self.tqm, self.inventory, self.play, self.serial)
+        finally:
+            self.tqm.cleanup()
+            self.inventory.clear_pattern_cache()
 
         hostvars = self.tqm.hostvars
         stats = self.tqm._stats
@@ -282,8 +537,9 @@ class ScriptExecAdapter(object):
         for host in hosts:
             t = stats.summarize(host)
             stats_sum[host] = t
-            hostvar = hostvars.__getitem__(host)
-            results[host] = hostvar['script_out']
+            if self.callback.on_result is None:
+                hostvar = hostvars.__getitem__(host)
+                results[host] = hostvar['script_out']
 
 #        self.tqm.send_callback(
 #            'walker2ansibleLog',
@@ -291,9 +547,4 @@ class ScriptExecAdapter(object):
 #            user_id=self.run_data['user_id'],
 #            run_success=run_success
 #        )
-
-        if self.tqm is not None:
-            self.tqm.cleanup()
-            os.remove(self.hosts_file.name)
-            self.inventory.clear_pattern_cache()
         return [state, stats_sum, results]
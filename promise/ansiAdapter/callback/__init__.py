@@ -0,0 +1,6 @@
+# -*- coding:utf-8 -*-
+# !/usr/bin/env python
+#
+# Author: Shawn.T
+# Email: shawntai.ds@gmail.com
+#
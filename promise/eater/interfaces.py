@@ -8,54 +8,72 @@
 # This is the interface module of eater package.
 
 from .. import app
-from .models import Network, IP
-from .utils import decrypt
+from .models import Network, IP, OSUser, BATCH_SIZE
+from .utils import decrypt_many
+
+
+def _fetch(model, column, keys):
+    """ Fetch objects of a model whose column value is in keys """
+    keys = list(set(keys))
+    result = []
+    for i in range(0, len(keys), BATCH_SIZE):
+        result.extend(model.query.filter(
+            column.in_(keys[i:i + BATCH_SIZE])).all())
+    return result
 
 
 def to_forward(ip_list):
     """ Inventory Args Interface for Forward """
     if ip_list and (isinstance(ip_list, list) or isinstance(ip_list, tuple)):
-        option = (
-            'enable_pass', 'model', 'name', 'vender', 'osuser', 'con_pass',
-            'connect', 'method', 'port', 'ip', 'id')
         inventory = []
-        network = Network()
+        # fetch ip, network, model, osuser and connect of all the ips
+        # with a few IN queries instead of a recursive query per ip
+        ips = dict((x.ip_addr, x) for x in _fetch(IP, IP.ip_addr, ip_list))
+        networks = dict((x.id, x) for x in _fetch(
+            Network, Network.id, [x.it_id for x in ips.values() if x.it_id]))
+        ips = dict((k, w) for k, w in ips.items() if w.it_id in networks)
+        models = dict(zip(networks.keys(), Network.load_relationship(
+            'model', networks.values())))
+        osusers = dict(zip(networks.keys(), Network.load_relationship(
+            'osuser', networks.values())))
+        users = dict(
+            (y.id, y) for x in osusers.values() for y in x
+            if y.name == app.config['FORWARD_USERNAME'])
+        user_connects = dict(zip(users.keys(), [
+            [k.id for k in x] for x in OSUser.load_relationship(
+                'connect', users.values())]))
+        ip_connects = dict(zip(ips.keys(), IP.load_relationship(
+            'connect', ips.values())))
+        connects = dict(
+            (k.id, k) for x in ip_connects.values() for k in x)
+        ip_connects = dict(
+            (k, set(y.id for y in w)) for k, w in ip_connects.items())
+        # decrypt all the passwords at once
+        ciphertexts = [x.enable_pass for x in networks.values()] + \
+            [x.con_pass for x in users.values()]
+        plaintexts = dict(zip(ciphertexts, decrypt_many(
+            app.config['FORWARD_USER_PRIVATE_KEY'], ciphertexts)))
         for x in ip_list:
-            ip = IP.query.filter_by(ip_addr=x).first()
-            id = ip.it_id if ip else None
-            if id:
-                y = network.get(id=id, depth=3, option=option)
-                if y:
-                    y = y[0]
-                    d = dict(ip=x, actpass=decrypt(
-                        privatekey=app.config['FORWARD_USER_PRIVATE_KEY'],
-                        ciphertext=y['enable_pass']))
-                    d['model'] = y['model'][0]['name'] if y['model'] else ''
-                    d['vender'] = y['model'][0]['vender'] if y['model'] else ''
-                    connect = None
-                    for k in y['ip']:
-                        if k['id'] == ip.id:
-                            connect = k['connect']
-                            break
-                    if connect and y['osuser']:
-                        for m in y['osuser']:
-                            if m['name'] == app.config['FORWARD_USERNAME']:
-                                for k in m['connect']:
-                                    if k in connect:
-                                        d['connect'] = k['method']
-                                        d['remote_port'] = k['port']
-                                        d['remote_user'] = m['name']
-                                        d['conpass'] = decrypt(
-                                            privatekey=app.config[
-                                                'FORWARD_USER_PRIVATE_KEY'],
-                                            ciphertext=m['con_pass'])
-                                        break
-                                if len(d) == 6:
-                                    break
-                    else:
-                        d['connect'], d['remote_port'] = '', ''
-                        d['remote_user'], d['conpass'] = '', ''
-                    inventory.append(d)
+            ip = ips.get(x)
+            if not ip:
+                continue
+            y = networks[ip.it_id]
+            d = dict(ip=x, actpass=plaintexts[y.enable_pass])
+            d['model'] = models[y.id][0].name if models[y.id] else ''
+            d['vender'] = models[y.id][0].vender if models[y.id] else ''
+            connect = ip_connects[x]
+            if connect and osusers[y.id]:
+                for m in osusers[y.id]:
+                    if m.name == app.config['FORWARD_USERNAME']:
+                        for k in user_connects[m.id]:
+                            if k in connect:
+                                d['connect'] = connects[k].method
+                                d['remote_port'] = connects[k].port
+                                d['remote_user'] = m.name
+                                d['conpass'] = plaintexts[m.con_pass]
+                                break
             else:
-                pass
+                d['connect'], d['remote_port'] = '', ''
+                d['remote_user'], d['conpass'] = '', ''
+            inventory.append(d)
         return inventory
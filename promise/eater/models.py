@@ -9,7 +9,11 @@
 
 from .. import db, app, utils  # , ma
 from sqlalchemy.ext.declarative import declared_attr
+from sqlalchemy import and_, or_, select, bindparam, func, text
+from collections import OrderedDict
 import re
+import socket
+import struct
 from datetime import datetime
 
 
@@ -28,6 +32,35 @@ def execute(sql):
 # my_default_database = None
 my_default_database = 'eater'
 
+# max number of keys in one IN clause while loading relationships
+BATCH_SIZE = 500
+
+
+def cidr_patterns(cidr):
+    """
+        Turn an ipv4 cidr into patterns of the addresses in it:
+        a list of LIKE patterns, or of whole addresses for prefixes longer
+        than 24, so that containment is told by plain string comparison.
+        Raise ValueError if the cidr is illegal.
+    """
+    addr, _, bits = str(cidr).partition('/')
+    bits = int(bits) if bits else 32
+    if not 0 <= bits <= 32 or addr.count('.') != 3:
+        raise ValueError('illegal cidr: %s' % cidr)
+    try:
+        n = struct.unpack('!I', socket.inet_aton(addr))[0]
+    except socket.error:
+        raise ValueError('illegal cidr: %s' % cidr)
+    n &= (0xffffffff << (32 - bits)) & 0xffffffff
+    octets = [str(x) for x in struct.unpack('4B', struct.pack('!I', n))]
+    k, r = divmod(bits, 8)
+    if not r:
+        return ['.'.join(octets)] if k == 4 else \
+            ['.'.join(octets[:k] + ['%'])]
+    base = int(octets[k])
+    return ['.'.join(octets[:k] + [str(x)] + (['%'] if k < 3 else []))
+            for x in range(base, base + (1 << (8 - r)))]
+
 
 class Doraemon(db.Model):
     """
@@ -110,41 +143,93 @@ class Doraemon(db.Model):
         return '<%s %r>' % (self.__class__.__name__, self.id)
     __repr__ = __str__
 
-    # output columns and relationships to dict using recursive method
-    def to_dict(self, count=0, depth=1, option=None, ignore=None):
-        columns = self.columns().keys()
-        relationships = self.relationships().keys()
+    # names of columns and relationships to be output by to_dict
+    # `ignore` has higher priority than `option`
+    @classmethod
+    def plan(cls, option=None, ignore=None):
+        columns = cls.__mapper__.columns.__dict__['_data'].keys()
+        relationships = cls.__mapper__.relationships.__dict__['_data'].keys()
         # if you want to drop something
-        # `ignore` has higher priority than `option`
         if ignore and (isinstance(ignore, list) or isinstance(ignore, tuple)):
             columns = [x for x in columns if x not in ignore]
         # see what you concern about
         if option and (isinstance(option, list) or isinstance(option, tuple)):
             columns = [x for x in columns if x in option]
             relationships = [x for x in relationships if x in option]
-        # get columns
-        d = {k: getattr(self, k) for k in columns}
+        return columns, relationships
+
+    # load relationship `key` for all the given objects of this class
+    # using one IN query (per chunk of keys) instead of one query per object
+    # output list[]: related objects of each given object, in the same order
+    @classmethod
+    def load_relationship(cls, key, objs):
+        mapper = cls.__mapper__
+        prop = mapper.relationships[key]
+        target = prop.mapper.class_
+        if prop.secondary is not None:
+            local, remote = prop.synchronize_pairs[0]
+            onclause = and_(
+                *[x == y for x, y in prop.secondary_synchronize_pairs])
+            query = db.session.query(target, remote).join(
+                prop.secondary, onclause)
+        else:
+            local, remote = prop.local_remote_pairs[0]
+            query = db.session.query(target, remote)
+        attr = mapper.get_property_by_column(local).key
+        keys = [getattr(x, attr) for x in objs]
+        related = {}
+        wanted = list(set(x for x in keys if x is not None))
+        for i in range(0, len(wanted), BATCH_SIZE):
+            rows = query.filter(
+                remote.in_(wanted[i:i + BATCH_SIZE])).order_by(target.id)
+            for obj, k in rows:
+                related.setdefault(k, []).append(obj)
+        return [related.get(k, []) for k in keys]
+
+    # output a list of objects to dicts level by level:
+    # each relationship of each level is loaded for the whole list at once
+    # output list[]: dicts of the given objects, in the same order
+    @staticmethod
+    def to_dicts(objs, count=0, depth=1, option=None, ignore=None):
         # recursion ends (better limit depth to be <= 3)
         # or it may risk to be maximum recursion depth exceeded
         depth = 3 if depth > 3 else depth
-        if not relationships or count == depth:
-            return d
-        count += 1
-        # get relationships
-        for k in relationships:
-            relation = getattr(self, k)
-            if relation:
-                if hasattr(relation, '__iter__'):
-                    d[k] = [x.to_dict(
-                        count=count, depth=depth, option=option, ignore=ignore)
-                        for x in relation if hasattr(x, 'to_dict')]
-                elif hasattr(relation, 'to_dict'):
-                    d[k] = [relation.to_dict(
-                        count=count, depth=depth, option=option,
-                        ignore=ignore)]
-            else:
-                d[k] = []
-        return d
+        dicts = [None] * len(objs)
+        # objects of subclasses have their own columns and relationships
+        groups = {}
+        for i, obj in enumerate(objs):
+            groups.setdefault(obj.__class__, []).append(i)
+        for cls, indexes in groups.items():
+            members = [objs[i] for i in indexes]
+            columns, relationships = cls.plan(option=option, ignore=ignore)
+            # get columns
+            for i, obj in zip(indexes, members):
+                dicts[i] = {k: getattr(obj, k) for k in columns}
+            if not relationships or count == depth:
+                continue
+            # get relationships
+            for k in relationships:
+                related = cls.load_relationship(k, members)
+                # output each distinct related object only once
+                unique = {}
+                for li in related:
+                    for x in li:
+                        unique.setdefault(id(x), x)
+                unique = unique.values()
+                done = dict(zip(
+                    [id(x) for x in unique],
+                    Doraemon.to_dicts(
+                        unique, count=count + 1, depth=depth,
+                        option=option, ignore=ignore)))
+                for i, li in zip(indexes, related):
+                    dicts[i][k] = [done[id(x)] for x in li]
+        return dicts
+
+    # output columns and relationships to dict
+    def to_dict(self, count=0, depth=1, option=None, ignore=None):
+        return self.to_dicts(
+            [self], count=count, depth=depth, option=option,
+            ignore=ignore)[0]
 
     # # output columns and relationships to dict using schema
     # # ---- schema has been deprecated cuz proved to be a waste of time ----
@@ -243,11 +328,198 @@ class Doraemon(db.Model):
                 app.logger.error(utils.logmsg(msg))
         return None
 
+    # insert or update records in bulk
+    # input list[]: dicts of factors of records,
+    #               many-to-many relationships given as lists of objects/ids
+    # input str: column used to tell whether a record exists or not
+    # input dict{}: factors used only when inserting a new record
+    # input int: number of records written (and committed) at a time
+    # output dict{}: ids of records inserted, updated and failed
+    def bulk_upsert(self, rows, key='id', defaults=None, chunk=None):
+        result = {'inserted': [], 'updated': [], 'failed': []}
+        chunk = chunk or app.config['EATER_BULK_CHUNK']
+        for i in range(0, len(rows), chunk):
+            # ids given by the rows, until the records are prepared
+            ids = [x.get('id') or x.get(key) for x in rows[i:i + chunk]]
+            try:
+                records = self._prepare(
+                    rows[i:i + chunk], key, defaults or {})
+                ids = [x[0]['id'] for x in records]
+                inserted, updated = self._write(records)
+                db.session.commit()
+                result['inserted'].extend(inserted)
+                result['updated'].extend(updated)
+            except Exception, e:
+                db.session.rollback()
+                result['failed'].extend(ids)
+                msg = self.__DoraemonContraintException % e
+                app.logger.error(utils.logmsg(msg))
+        return result
+
+    # split rows into columns and many-to-many relationships,
+    # find out ids of existing records and merge rows with the same id
+    # output list[]: (columns, relationships, existing tables) of each record
+    def _prepare(self, rows, key, defaults):
+        cls = self.__class__
+        mapper = cls.__mapper__
+        now = datetime.now()
+        records = OrderedDict()
+        found = {}
+        if key != 'id':
+            col = mapper.get_property(key).columns[0]
+            pk = col.table.primary_key.columns.values()[0]
+            keys = list(set(x[key] for x in rows if x.get(key) is not None))
+            if keys:
+                found = dict(db.session.execute(
+                    select([col, pk]).where(col.in_(keys)),
+                    mapper=mapper).fetchall())
+        for row in rows:
+            cols, relations, isColComplete, isRelComplete = \
+                self.checkColumnsAndRelations(**row)
+            if not cols.get('id'):
+                cols['id'] = found.get(cols.get(key)) or \
+                    utils.genUuid(cls.__name__)
+            # set last update time by default
+            cols['last_update_time'] = now
+            if cols['id'] in records:
+                records[cols['id']][0].update(cols)
+                records[cols['id']][1].update(relations)
+            else:
+                records[cols['id']] = (cols, relations)
+        # tables of the model from super class to sub class
+        tables = [
+            x.local_table for x in reversed(list(mapper.iterate_to_root()))]
+        pks = [x.primary_key.columns.values()[0] for x in tables]
+        joins = tables[0]
+        for x, pk in zip(tables[1:], pks[1:]):
+            joins = joins.outerjoin(x, pk == pks[0])
+        exist = {}
+        for x in db.session.execute(
+                select(pks).select_from(joins).where(
+                    pks[0].in_(records.keys())), mapper=mapper):
+            exist[x[0]] = [t for t, y in zip(tables, x) if y is not None]
+        output = []
+        for id, (cols, relations) in records.items():
+            if id not in exist:
+                cols = dict(defaults, **cols)
+                relations = dict(
+                    {k: w for k, w in defaults.items()
+                     if k in mapper.relationships.keys()}, **relations)
+            # set category by default for the new record of this model
+            if tables[-1] not in exist.get(id, []):
+                cols.setdefault('category', cls.__name__)
+            output.append((cols, relations, exist.get(id, [])))
+        return output
+
+    # write records into tables and secondary tables using executemany
+    # output list[]: ids of records inserted and updated
+    def _write(self, records):
+        mapper = self.__class__.__mapper__
+        tables = [
+            x.local_table for x in reversed(list(mapper.iterate_to_root()))]
+        inserted, updated = [], []
+        for cols, relations, exist in records:
+            if exist:
+                updated.append(cols['id'])
+            else:
+                inserted.append(cols['id'])
+        for table in tables:
+            pk = table.primary_key.columns.values()[0]
+            names = [(x.name, mapper.get_property_by_column(x).key)
+                     for x in table.columns]
+            inserts, updates = [], []
+            for cols, relations, exist in records:
+                values = {n: cols[k] for n, k in names if k in cols}
+                if table not in exist:
+                    values[pk.name] = cols['id']
+                    inserts.append(values)
+                else:
+                    values.pop(pk.name, None)
+                    if values:
+                        values['_doraemon_id'] = cols['id']
+                        updates.append(values)
+            self._executemany(table.insert(), inserts)
+            self._executemany(
+                table.update().where(pk == bindparam('_doraemon_id')),
+                updates)
+        # many-to-many relationships are replaced as a whole
+        for k, w in mapper.relationships.items():
+            if w.secondary is None:
+                continue
+            local, sec_local = w.synchronize_pairs[0]
+            remote, sec_remote = w.secondary_synchronize_pairs[0]
+            attr = w.mapper.get_property_by_column(remote).key
+            parents, pairs = [], []
+            for cols, relations, exist in records:
+                if k not in relations:
+                    continue
+                parents.append(cols['id'])
+                for x in relations[k] or []:
+                    pairs.append({
+                        sec_local.name: cols['id'],
+                        sec_remote.name: getattr(x, attr, x)})
+            if parents:
+                db.session.execute(
+                    w.secondary.delete().where(sec_local.in_(parents)),
+                    mapper=mapper)
+                self._executemany(w.secondary.insert(), pairs)
+        return inserted, updated
+
+    # executemany asks for the same keys in each row
+    def _executemany(self, statement, rows):
+        groups = OrderedDict()
+        for x in rows:
+            groups.setdefault(tuple(sorted(x.keys())), []).append(x)
+        for x in groups.values():
+            db.session.execute(
+                statement, x, mapper=self.__class__.__mapper__)
+
+    # build a query of records s.t. conditions, run as one sql statement
+    # input dict{}: conditions for search, with extra operators in `where`:
+    # 'in': {column: values}, 'prefix': {column: prefix},
+    # 'since'/'until': range of last_update_time, 'cidr': net of ip_addr
+    # input list[]: names of columns to sort by, '-' ahead for descending
+    # output query
+    def search(self, where=None, order=None, **kw):
+        cls = self.__class__
+        cols = self.checkColumnsAndRelations(**kw)[0] if kw else {}
+        query = cls.query.filter_by(**cols)
+        where = where or {}
+        for k, w in where.get('in', {}).items():
+            query = query.filter(getattr(cls, k).in_(w))
+        for k, w in where.get('prefix', {}).items():
+            w = re.sub(r'([\\%_])', r'\\\1', w)
+            query = query.filter(getattr(cls, k).like(w + '%', escape='\\'))
+        if where.get('since'):
+            query = query.filter(cls.last_update_time >= where['since'])
+        if where.get('until'):
+            query = query.filter(cls.last_update_time < where['until'])
+        if where.get('cidr'):
+            patterns = cidr_patterns(where['cidr'])
+            if patterns != ['%']:
+                query = query.filter(or_(*[
+                    cls.ip_addr.like(x) if x.endswith('%') else
+                    cls.ip_addr == x for x in patterns]))
+        for x in order or []:
+            column = getattr(cls, x.lstrip('-'))
+            query = query.order_by(
+                column.desc() if x.startswith('-') else column)
+        return query.order_by(cls.id)
+
     # get (a) record(s)
     # input dict{}: conditions for search
     # output json list[]: record(s) s.t. conditions
     def get(self, page=None, per_page=20, depth=1, option=None,
-            ignore=None, **kw):
+            ignore=None, where=None, order=None, **kw):
+        if where or order:
+            query = self.search(where=where, order=order, **kw)
+            if page:
+                li = query.paginate(page, per_page, False)
+                return self.to_dicts(
+                    li.items, depth=depth, option=option,
+                    ignore=ignore), li.pages
+            return self.to_dicts(
+                query.all(), depth=depth, option=option, ignore=ignore)
         if not kw:
             if page:
                 li = self.__class__.query.paginate(page, per_page, False)
@@ -257,13 +529,53 @@ class Doraemon(db.Model):
             li = self._exist(**kw)
         if li:
             if not kw and page:
-                return [
-                    x.to_dict(depth=depth, option=option, ignore=ignore)
-                    for x in li.items], li.pages
-            return [x.to_dict(
-                depth=depth, option=option, ignore=ignore) for x in li]
+                return self.to_dicts(
+                    li.items, depth=depth, option=option,
+                    ignore=ignore), li.pages
+            return self.to_dicts(
+                li, depth=depth, option=option, ignore=ignore)
         return []
 
+    # get records following a cursor, in order of id
+    # input str: id of the last record got (the cursor), None for the first
+    # input int: max number of records to get
+    # input dict{}: conditions for search
+    # output [json list[], str]: records and the cursor of the next ones,
+    # which is None if there are no more
+    def getAfter(self, after=None, limit=20, depth=1, option=None,
+                 ignore=None, where=None, **kw):
+        cls = self.__class__
+        query = self.search(where=where, **kw)
+        if after is not None:
+            query = query.filter(cls.id > after)
+        li = query.limit(limit).all()
+        after = li[-1].id if len(li) == limit else None
+        return [self.to_dicts(
+            li, depth=depth, option=option, ignore=ignore), after]
+
+    # count records s.t. conditions without loading them
+    # input dict{}: conditions for search, the same as search()
+    # output int: number of records
+    def count(self, where=None, **kw):
+        return self.search(where=where, **kw).order_by(None).count()
+
+    # estimate number of all records of the table cheaply, no filter applied,
+    # by table statistics of mysql, or by counting for other databases
+    # output int: number of records
+    def estimate(self):
+        table = self.__class__.__table__
+        mapper = self.__class__.__mapper__
+        if db.session.get_bind(mapper=mapper).dialect.name == 'mysql':
+            q = text(
+                'select table_rows from information_schema.tables '
+                'where table_schema = database() and table_name = :name')
+            count = db.session.execute(
+                q, {'name': table.name}, mapper=mapper).scalar()
+            if count is not None:
+                return int(count)
+        q = select([func.count()]).select_from(table)
+        return db.session.execute(q, mapper=mapper).scalar()
+
     # get an object by id
     # input str: object id for search
     # output db.Model (only used for many-to-many relationships)
@@ -713,3 +1025,16 @@ class Group(Doraemon):
     it = db.relationship(
         'ITEquipment', secondary='it2group',
         enable_typechecks=False, lazy='dynamic')
+
+
+class SyncDigest(Doraemon):
+    """
+        Content Digest Model of Synchronized Objects.
+        id is given as '<model name>-<object id>'.
+    """
+    __bind_key__ = my_default_database
+
+    # model name of the synchronized object
+    model = db.Column(db.String(64), index=True)
+    # digest of the object content at the last synchronization
+    digest = db.Column(db.String(64))
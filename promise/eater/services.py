@@ -15,7 +15,13 @@ from .. import app, utils
 """
     Data Services
 """
-from .models import ITEquipment, Group, IP
+from .models import ITEquipment, Group, IP, cidr_patterns
+
+
+def cidr(value):
+    """ Input type of an ipv4 cidr """
+    cidr_patterns(value)
+    return value
 
 
 class DoraemonListAPI(Resource):
@@ -31,6 +37,9 @@ class DoraemonListAPI(Resource):
     """
     __abstract__ = True
 
+    # define custom error msg
+    __ParamsIllegal = 'Parameter Illegal: %s.'
+
     # constructor
     def __init__(self, obj, ignore=None, **kw):
         super(DoraemonListAPI, self).__init__()
@@ -43,6 +52,19 @@ class DoraemonListAPI(Resource):
         self.parser.add_argument(
             'pp', type=inputs.positive,
             help='PerPage must be a positive integer', dest='per_page')
+        # after: id of the last item got, to get the items following it
+        self.parser.add_argument(
+            'after', type=str,
+            help='after must be an id')
+        # limit: max number of items following the cursor
+        self.parser.add_argument(
+            'limit', type=inputs.positive,
+            help='limit must be a positive integer')
+        # if ask for an estimated number of all items of the table
+        # with the cursor, filters are not taken into account
+        self.parser.add_argument(
+            'estimate', type=inputs.boolean,
+            help='estimate must be boolean')
         # if ask for more specific informations
         self.parser.add_argument(
             'extend', type=inputs.boolean,
@@ -51,17 +73,60 @@ class DoraemonListAPI(Resource):
         self.parser.add_argument(
             'opt', type=str,
             help='options must be splited by %%')
+        # columns to sort by, '-' ahead for descending
+        self.parser.add_argument(
+            'sort', type=str,
+            help='sort keys must be splited by %%')
+        # if ask for the number of items only
+        self.parser.add_argument(
+            'count', type=inputs.boolean,
+            help='count must be boolean')
+        # range of last update time
+        self.parser.add_argument(
+            'since', type=inputs.datetime_from_iso8601,
+            help='since must be an iso8601 datetime')
+        self.parser.add_argument(
+            'until', type=inputs.datetime_from_iso8601,
+            help='until must be an iso8601 datetime')
         # multi-type parameters
+        # each of them can also be searched by a list of values (<param>_in)
+        # and string ones by prefix (<param>_prefix)
         setattr(self, 'params', [])
+        setattr(self, 'str_params', [])
         type_dict = {'str_params': str, 'int_params': inputs.positive}
         for k, w in kw.items():
             if k in type_dict.keys():
                 self.params.extend(w)
                 for x in w:
                     self.parser.add_argument(x, type=type_dict[k])
+                    self.parser.add_argument(
+                        x + '_in', type=type_dict[k], action='append')
+                    if k == 'str_params':
+                        self.str_params.append(x)
+                        self.parser.add_argument(x + '_prefix', type=str)
+        # network which ip addresses belong to
+        if 'ip_addr' in self.params:
+            self.parser.add_argument(
+                'cidr', type=cidr, help='cidr must be like 10.0.0.0/8')
         setattr(self, 'obj', obj)
         setattr(self, 'ignore', ignore)
 
+    # conditions beyond exact match, None if there are none
+    def where(self, args):
+        where = {}
+        ins = dict((x, args[x + '_in']) for x in self.params
+                   if args[x + '_in'] is not None)
+        if ins:
+            where['in'] = ins
+        prefixes = dict((x, args[x + '_prefix']) for x in self.str_params
+                        if args[x + '_prefix'])
+        if prefixes:
+            where['prefix'] = prefixes
+        for x in ('since', 'until', 'cidr'):
+            if args.get(x):
+                where[x] = args[x]
+        return where or None
+
     # get whole list of the object
     @auth.PrivilegeAuth(privilegeRequired="inventoryAdmin")
     def get(self):
@@ -72,21 +137,49 @@ class DoraemonListAPI(Resource):
                 kw[x] = args[x]
         option = args['opt'].split('%%') if args['opt'] else None
         depth = 1 if args['extend'] else 0
+        where = self.where(args)
+        order = args['sort'].split('%%') if args['sort'] else None
+        if order:
+            columns = self.obj.columns().keys()
+            illegal = [x for x in order if x.lstrip('-') not in columns]
+            if illegal:
+                msg = self.__ParamsIllegal % {'sort': illegal}
+                app.logger.error(utils.logmsg(msg))
+                return {'error': msg}, 400
+        # count only, no record is loaded
+        if args['count']:
+            return {'total': self.obj.count(where=where, **kw)}, 200
+        # paging by cursor, it costs the same however deep it goes,
+        # items follow the order of ids, so sort is not allowed with it
+        if args['after'] is not None or args['limit']:
+            if order:
+                msg = self.__ParamsIllegal % {'sort': order}
+                app.logger.error(utils.logmsg(msg))
+                return {'error': msg}, 400
+            [data, after] = self.obj.getAfter(
+                after=args['after'], limit=args['limit'] or 20, depth=depth,
+                option=option, ignore=self.ignore, where=where, **kw)
+            response = {'after': after, 'data': data}
+            if args['estimate']:
+                response['estimated_total'] = self.obj.estimate()
+            return response, 200
         page = args['page']
-        if kw or not page:
+        if (kw and not (where or order)) or not page:
             data = self.obj.get(
-                depth=depth, option=option, ignore=self.ignore, **kw)
+                depth=depth, option=option, ignore=self.ignore,
+                where=where, order=order, **kw)
         else:
             query = []
             per_page = args['per_page']
             if per_page:
                 query = self.obj.get(
                     page=page, per_page=per_page, depth=depth,
-                    option=option, ignore=self.ignore, **kw)
+                    option=option, ignore=self.ignore,
+                    where=where, order=order, **kw)
             else:
                 query = self.obj.get(
                     page=page, depth=depth, option=option,
-                    ignore=self.ignore, **kw)
+                    ignore=self.ignore, where=where, order=order, **kw)
             if query:
                 data, pages = query[0], query[1]
         return {'totalpage': pages, 'data': data}, 200
@@ -7,21 +7,85 @@
 #
 # This is the task module of eater package.
 
-from .. import app, utils
+from .. import app, db, utils
 from .schedules import celery
 from ..zabber.models import Host, HostGroup
-from .models import execute, ITEquipment, IP, Group, ITModel, OSUser, \
-    Connection, Network
+from .models import ITEquipment, IP, Group, ITModel, OSUser, \
+    Connection, Network, SyncDigest
 import random
+import hashlib
+import json
 
 __DoraemonUpdateNotify = 'Doraemon Update Notify: %s.'
 
 
+def _notify(model, result):
+    """
+        Log the result of a bulk upsert.
+    """
+    msg = __DoraemonUpdateNotify % (
+        '<%s> %d inserted, %d updated, %d failed' % (
+            model, len(result['inserted']), len(result['updated']),
+            len(result['failed'])))
+    if result['failed']:
+        app.logger.error(utils.logmsg(msg))
+    else:
+        app.logger.info(utils.logmsg(msg))
+
+
+def _digest(row):
+    """
+        Digest of the content of an object.
+    """
+    return hashlib.md5(json.dumps(row, sort_keys=True)).hexdigest()
+
+
+def _sync(model, rows, defaults=None, incremental=True):
+    """
+        Write objects changed since the last synchronization,
+        which is told by the content digests stored in SyncDigest.
+        Return counts of objects added, changed and removed.
+    """
+    name = model.__name__
+    last = dict(
+        (x.id, x.digest) for x in SyncDigest.query.filter_by(model=name))
+    exist = set(x for x, in db.session.query(model.id))
+    current, changes = {}, []
+    for row in rows:
+        key = '%s-%s' % (name, row['id'])
+        current[key] = _digest(row)
+        if not incremental or row['id'] not in exist or \
+                last.get(key) != current[key]:
+            changes.append(row)
+    ret = model().bulk_upsert(changes, defaults=defaults)
+    _notify(name, ret)
+    # keep digests of objects written successfully
+    failed = set(ret['failed'])
+    SyncDigest().bulk_upsert(
+        [dict(id='%s-%s' % (name, x['id']), model=name,
+              digest=current['%s-%s' % (name, x['id'])])
+         for x in changes if x['id'] not in failed])
+    # objects gone from the source are not deleted from eater,
+    # only their digests are dropped
+    removed = [x for x in last if x not in current]
+    try:
+        if removed:
+            SyncDigest.query.filter(SyncDigest.id.in_(removed)).delete(
+                synchronize_session=False)
+            db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(utils.logmsg(e))
+    return {'added': len(ret['inserted']), 'changed': len(ret['updated']),
+            'removed': len(removed)}
+
+
 @celery.task(bind=True, name='host_sync')
-def host_sync(self):
+def host_sync(self, incremental=True):
     """
         Update host relative infos.
         From Zabber to Eater.
+        Only hosts changed since the last sync are written if incremental.
     """
     try:
         # mark the beginning
@@ -37,14 +101,11 @@ def host_sync(self):
         # 1. get hostgroup
         hostgroups = HostGroup().get()
         # Model Group synchronization for eater
-        group = Group()
-        for hg in hostgroups:
-            g = group.update(id=hg['groupid'], name=hg['name'])
-            if not g:
-                g = group.insert(id=hg['groupid'], name=hg['name'])
-            if g:
-                msg = __DoraemonUpdateNotify % ('<Group %s>' % g['id'])
-                app.logger.info(utils.logmsg(msg))
+        counts = {}
+        counts['Group'] = _sync(
+            Group, [dict(id=hg['groupid'], name=hg['name'])
+                    for hg in hostgroups], incremental=incremental)
+        gids = set(hg['groupid'] for hg in hostgroups)
         # for progress bar
         prog = random.randint(prog, 30)
         self.update_state(
@@ -54,24 +115,18 @@ def host_sync(self):
         # 2. get host
         hosts = Host().get()
         # Model ITEquipment synchronization for eater
-        it = ITEquipment()
         # add default ITModel
         model = ITModel.query.filter_by(name='bclinux7').first()
         m_id = model.id if model else None
         # add default OSUser
         user = OSUser.query.filter_by(name='python_script').all()
-        for h in hosts:
-            g = [group.getObject(i) for i in [y['groupid']
-                 for y in [x for x in h['groups']]]]
-            t = it.update(id=h['hostid'], label=h['host'],
-                          name=h['name'], group=g)
-            if not t:
-                t = it.insert(
-                    id=h['hostid'], label=h['host'], name=h['name'],
-                    group=g, model_id=m_id, osuser=user)
-            if t:
-                msg = __DoraemonUpdateNotify % ('<ITEquipment %s>' % t['id'])
-                app.logger.info(utils.logmsg(msg))
+        counts['ITEquipment'] = _sync(
+            ITEquipment,
+            [dict(id=h['hostid'], label=h['host'], name=h['name'],
+                  group=sorted(y['groupid'] for y in h['groups']
+                               if y['groupid'] in gids)) for h in hosts],
+            defaults=dict(model_id=m_id, osuser=user),
+            incremental=incremental)
         # for progress bar
         prog = random.randint(prog, 70)
         self.update_state(
@@ -79,22 +134,14 @@ def host_sync(self):
             meta={'current': prog, 'total': 100, 'message': ''})
 
         # Model IP synchronization for eater
-        ip = IP()
         # add default Connection
         connect = Connection.query.filter_by(method='ssh', port=22).all()
-        for h in hosts:
-            inf = h['interfaces']
-            if inf:
-                # use first ip as default
-                p = ip.update(id=inf[0]['interfaceid'],
-                              ip_addr=inf[0]['ip'], it_id=h['hostid'])
-                if not p:
-                    p = ip.insert(
-                        id=inf[0]['interfaceid'], ip_addr=inf[0]['ip'],
-                        it_id=h['hostid'], connect=connect)
-                if p:
-                    msg = __DoraemonUpdateNotify % ('<IP %s>' % p['id'])
-                    app.logger.info(utils.logmsg(msg))
+        # use first ip as default
+        counts['IP'] = _sync(
+            IP, [dict(id=h['interfaces'][0]['interfaceid'],
+                      ip_addr=h['interfaces'][0]['ip'], it_id=h['hostid'])
+                 for h in hosts if h['interfaces']],
+            defaults=dict(connect=connect), incremental=incremental)
         # for progress bar
         prog = random.randint(prog, 100)
         self.update_state(
@@ -104,7 +151,8 @@ def host_sync(self):
         # mark the end
         msg = __DoraemonUpdateNotify % 'Host Infos are Up-to-the-Minute'
         app.logger.info(utils.logmsg(msg))
-        return {'current': 100, 'total': 100, 'message': msg}
+        return {'current': 100, 'total': 100, 'message': msg,
+                'counts': counts}
     except Exception as e:
         # mark the errors
         app.logger.error(utils.logmsg(e))
@@ -132,7 +180,23 @@ def network_sync(self):
             state='PROGRESS',
             meta={'current': prog, 'total': 100, 'message': ''})
 
-        # 1. get infos from older-forward database
+        # 1. lookup tables of eater
+        ips = dict((x.ip_addr, (x.id, x.it_id)) for x in db.session.query(
+            IP.ip_addr, IP.id, IP.it_id))
+        connects = {}
+        for x in db.session.query(
+                Connection.method, Connection.port, Connection.id):
+            connects.setdefault((x.method, str(x.port)), []).append(x.id)
+        models = dict(((x.name, x.vender), x.id) for x in db.session.query(
+            ITModel.name, ITModel.vender, ITModel.id))
+        # for progress bar
+        prog = random.randint(prog, 30)
+        self.update_state(
+            state='PROGRESS',
+            meta={'current': prog, 'total': 100, 'message': ''})
+
+        # 2. stream infos from older-forward database by chunks
+        # and write them into eater
         connect = MySQLdb.connect(
             host=app.config['FORWARD_DB_HOST'],
             user=app.config['FORWARD_DB_USER'],
@@ -140,54 +204,48 @@ def network_sync(self):
             db=app.config['FORWARD_DB_NAME'],
             port=app.config['FORWARD_DB_PORT'],
             connect_timeout=app.config['FORWARD_DB_TIMEOUT'])
-        cursor = connect.cursor(MySQLdb.cursors.DictCursor)
-        cursor.execute('select * from deviceinfo')
-        result = cursor.fetchall()
-        connect.close()
-        if not result:
+        total = 0
+        ret = {'IP': {'inserted': [], 'updated': [], 'failed': []},
+               'Network': {'inserted': [], 'updated': [], 'failed': []}}
+        try:
+            cursor = connect.cursor(MySQLdb.cursors.SSDictCursor)
+            cursor.execute('select * from deviceinfo')
+            while True:
+                result = cursor.fetchmany(app.config['EATER_BULK_CHUNK'])
+                if not result:
+                    break
+                total += len(result)
+                rows = {'IP': [], 'Network': []}
+                for x in result:
+                    p = ips.get(x['ip'])
+                    if p:
+                        rows['IP'].append(dict(
+                            id=p[0], connect=connects.get(
+                                (x['loginMethod'], str(x['port'])), [])))
+                        # an existing ITEquipment is turned into a Network
+                        if p[1]:
+                            rows['Network'].append(dict(
+                                id=p[1], enable_pass=x['secondPassword'],
+                                model_id=models.get(
+                                    (x['deviceNumber'], x['deviceType']))))
+                    else:
+                        msg = __DoraemonUpdateNotify % (
+                            'Unknown <IP=%16s>' % x['ip'])
+                        app.logger.warn(utils.logmsg(msg))
+                for k, w in (('IP', IP), ('Network', Network)):
+                    for y, z in w().bulk_upsert(rows[k]).items():
+                        ret[k][y].extend(z)
+        finally:
+            connect.close()
+        if not total:
             msg = __DoraemonUpdateNotify % (
                 'Sorry but nothing available now from the remote database.')
             app.logger.warn(utils.logmsg(msg))
             return {'current': 100, 'total': 100, 'message': msg}
-        # for progress bar
-        prog = random.randint(prog, 30)
-        self.update_state(
-            state='PROGRESS',
-            meta={'current': prog, 'total': 100, 'message': ''})
-
-        # 2. data synchronization for eater
-        # Model Network synchronization for eater
-        nk = Network()
         # Model IP synchronization for eater
-        ip = IP()
-        # add default Connection
-        for x in result:
-            p = IP.query.filter_by(ip_addr=x['ip']).first()
-            if p:
-                connect = Connection.query.filter_by(
-                    method=x['loginMethod'], port=x['port']).all()
-                if ip.update(id=p.id, connect=connect):
-                    msg = __DoraemonUpdateNotify % ('<IP %s>' % p.id)
-                    app.logger.info(utils.logmsg(msg))
-                model = ITModel.query.filter_by(
-                    name=x['deviceNumber'], vender=x['deviceType']).first()
-                m_id = model.id if model else None
-                n = nk.update(
-                    id=p.it_id, enable_pass=x['secondPassword'], model_id=m_id)
-                if not n:
-                    ret = execute(
-                        'insert into network (id, enable_pass)'
-                        ' values ("%s", "%s");' %
-                        (p.it_id, x['secondPassword']))
-                    if ret:
-                        n = nk.update(
-                            id=p.it_id, model_id=m_id, category='Network')
-                if n:
-                    msg = __DoraemonUpdateNotify % ('<Network %s>' % n['id'])
-                    app.logger.info(utils.logmsg(msg))
-            else:
-                msg = __DoraemonUpdateNotify % ('Unknown <IP=%16s>' % x['ip'])
-                app.logger.warn(utils.logmsg(msg))
+        _notify('IP', ret['IP'])
+        # Model Network synchronization for eater
+        _notify('Network', ret['Network'])
         # for progress bar
         prog = random.randint(prog, 100)
         self.update_state(
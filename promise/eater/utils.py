@@ -8,6 +8,7 @@
 # This is the utility module of eater package.
 
 from .. import app
+from .. import utils as promiseUtils
 import md5
 from passlib.apps import custom_app_context as pwd_context
 
@@ -44,17 +45,77 @@ def verify_password(password, password_hash):
 
 import binascii
 import rsa
+import os
+import time
+import threading
+from collections import OrderedDict
 
+# parsed private keys: path -> (mtime, key)
+__keys = {}
+# decrypted plaintexts: (path, ciphertext) -> (expire time, plaintext)
+__plaintexts = OrderedDict()
+__lock = threading.Lock()
 
-def decrypt(privatekey, ciphertext):
+
+def load_privatekey(privatekey):
+    """
+        Load a private key file, parsed only once until it is modified.
+    """
+    mtime = os.path.getmtime(privatekey)
+    with __lock:
+        cached = __keys.get(privatekey)
+    if cached and cached[0] == mtime:
+        return cached[1]
     with open(privatekey) as privatefile:
         p = privatefile.read()
         pri = rsa.PrivateKey.load_pkcs1(p)
+    with __lock:
+        __keys[privatekey] = (mtime, pri)
+    return pri
+
+
+def decrypt(privatekey, ciphertext):
+    # plaintexts are kept in memory only if the cache size is set
+    size = app.config['EATER_DECRYPT_CACHE_SIZE']
+    key = (privatekey, ciphertext)
+    if size:
+        with __lock:
+            cached = __plaintexts.pop(key, None)
+            if cached and cached[0] > time.time():
+                __plaintexts[key] = cached
+                return cached[1]
+    pri = load_privatekey(privatekey)
     ciphertextAscii = binascii.a2b_hex(ciphertext)
     plaintext = rsa.decrypt(ciphertextAscii, pri)
+    if size:
+        with __lock:
+            __plaintexts[key] = (
+                time.time() + app.config['EATER_DECRYPT_CACHE_TTL'],
+                plaintext)
+            while len(__plaintexts) > size:
+                __plaintexts.popitem(last=False)
     return plaintext
 
 
+def decrypt_many(privatekey, ciphertexts):
+    """
+        Decrypt a list of ciphertexts with the same private key.
+        Each distinct ciphertext is decrypted only once.
+        A missing or broken ciphertext turns into an empty plaintext,
+        so that it does not fail the others.
+    """
+    plaintexts = {None: ''}
+    for x in ciphertexts:
+        if x not in plaintexts:
+            try:
+                plaintexts[x] = decrypt(privatekey, x)
+            except Exception as e:
+                msg = 'Decrypt Exception: %s.' % e
+                app.logger.error(promiseUtils.logmsg(msg))
+                plaintexts[x] = ''
+    return [plaintexts[x] for x in ciphertexts]
+
+
 def encrypt(publickey, plaintext):
     with open(publickey) as publicfile:
         p = publicfile.read()
@@ -22,6 +22,12 @@ from itsdangerous import TimedJSONWebSignatureSerializer as Serializer
 from itsdangerous import SignatureExpired, BadSignature, BadData
 import datetime
 import time
+import hashlib
+
+# verified tokens: digest of token -> [user_id, username, priv_name_list],
+# each kept until the token expires at most
+verified_tokens = utils.TTLCache(
+    app.config['AUTH_TOKEN_CACHE_SIZE'], app.config['AUTH_TOKEN_CACHE_TTL'])
 
 
 class TokenAPI(Resource):
@@ -260,12 +266,22 @@ class AuthMethods(Resource):
 
     @staticmethod
     def tokenAuth(token):
+        # token verified lately, no need to check the signature again
+        if isinstance(token, unicode):
+            token = token.encode('utf-8')
+        key = hashlib.sha1(token).hexdigest()
+        cached = verified_tokens.get(key)
+        if cached:
+            [user_id, username, priv_name_list] = cached
+            msg = 'user(' + username + ') logged in by cached token.'
+            app.logger.debug(utils.logmsg(msg))
+            return [user_id, priv_name_list, msg]
         # token decoding
         s = Serializer(
             secret_key=app.config['SECRET_KEY'],
             salt=app.config['AUTH_SALT'])
         try:
-            data = s.loads(token)
+            [data, header] = s.loads(token, return_header=True)
             # token decoding faild
             # if it happend a plenty of times, there might be someone
             # trying to attact your server, so it should be a warning.
@@ -298,6 +314,9 @@ class AuthMethods(Resource):
         app.logger.debug(utils.logmsg(msg))
         user_id = data['user_id']
         priv_name_list = data['priv']
+        verified_tokens.set(
+            key, [user_id, data['username'], priv_name_list],
+            header['exp'] - time.time())
         return [user_id, priv_name_list, msg]
 
     @staticmethod
@@ -331,6 +350,8 @@ class PrivilegeAuth(Resource):
     'privilege' table.
     If your method's 'required privilege' is one of user's privileges,
     user will be allowed to access the method, otherwise not.
+    With no 'required privilege', any valid user is allowed, and the method
+    checks what the user owns itself.
     ps. user's privilege is checked by his token.
     """
     def __init__(self, privilegeRequired):
@@ -350,11 +371,14 @@ class PrivilegeAuth(Resource):
                 msg = msg + " when autherization"
                 raise utils.InvalidAPIUsage(msg)
             else:
-                current_user = User.getValidUser(user_id=user_id)
+                current_user = User.getCachedValidUser(user_id)
                 if not current_user:
                     msg = "cannot find user when autherization"
                     raise utils.InvalidAPIUsage(msg)
 
+            if self.privilege_required is None:
+                g.current_user = current_user
+                return fn(*args, **kwargs)
             u_priv_name = unicode(self.privilege_required, "UTF-8")
             for priv_name in priv_name_list:
                 if u_priv_name == priv_name:
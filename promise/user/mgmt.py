@@ -33,10 +33,7 @@ class UserAPI(Resource):
             return {"message": msg, "user_info": user_info}, 200
         else:
             users = User.getValidUser()
-            user_info_list = list()
-            for user in users:
-                user_info = user.getDictInfo()
-                user_info_list.append(user_info)
+            user_info_list = User.getDictInfoList(users)
             msg = "infomations of all users."
             return {'message': msg, 'user_list': user_info_list}, 200
 
@@ -10,9 +10,22 @@
 from .. import db, app
 from .. import utils, ma
 from sqlalchemy import sql, and_
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
 
 import datetime
 
+# column values of valid users by user_id,
+# dropped once the user is saved
+valid_users = utils.TTLCache(
+    app.config['AUTH_USER_CACHE_SIZE'], app.config['AUTH_USER_CACHE_TTL'])
+# roles and privileges of users by user_id, dropped once the user is saved,
+# and all dropped once any role or privilege is saved
+user_privileges = utils.TTLCache(
+    app.config['AUTH_USER_CACHE_SIZE'], app.config['AUTH_USER_CACHE_TTL'])
+# number of users whose roles and privileges are read in one query
+RESOLVE_BATCH_SIZE = 500
+
 
 """
 This is a HELPER table for the role_table and user_table to set up
@@ -103,8 +116,14 @@ class User(db.Model):
             msg = utils.logmsg('exception: %s.' % e)
             app.logger.info(msg)
             state = False
+        valid_users.pop(self.user_id)
+        user_privileges.pop(self.user_id)
         return [state, msg]
 
+    def setInvalid(self):
+        self.valid = 0
+        valid_users.pop(self.user_id)
+
     @staticmethod
     def getValidUser(username=None, user_id=None):
         if username is not None and user_id is None:
@@ -118,9 +137,93 @@ class User(db.Model):
             user = User.query.filter_by(valid=1).all()
         return user
 
-    def getDictInfo(self):
-        priv_list = self.getPrivilegeList()
-        role_list = self.getRoleList()
+    @staticmethod
+    def getCachedValidUser(user_id):
+        """
+        get the valid user by user_id, without reading the db
+        if the user is in the cache of valid users.
+        """
+        values = valid_users.get(user_id)
+        if values is None:
+            user = User.getValidUser(user_id=user_id)
+            if user:
+                valid_users.set(user_id, dict(
+                    (x.key, getattr(user, x.key))
+                    for x in User.__mapper__.column_attrs))
+            return user
+        # rebuild the user as loaded from the db, then put it in session
+        user = User.__mapper__.class_manager.new_instance()
+        for key, value in values.items():
+            set_committed_value(user, key, value)
+        make_transient_to_detached(user)
+        return db.session.merge(user, load=False)
+
+    @staticmethod
+    def resolvePrivileges(user_ids):
+        """
+        roles and privileges of users, read for all the users not cached
+        in a single query per batch. return a dict of
+        user_id -> {'role': role_list, 'privilege': priv_list}.
+        """
+        resolved = dict()
+        missed = list()
+        for user_id in user_ids:
+            cached = user_privileges.get(user_id)
+            if cached is None:
+                missed.append(user_id)
+            else:
+                resolved[user_id] = cached
+        for i in range(0, len(missed), RESOLVE_BATCH_SIZE):
+            batch = missed[i:i + RESOLVE_BATCH_SIZE]
+            q = sql.select([
+                roles.c.user_id, Role.role_id, Role.role_name,
+                Role.description, Role.valid,
+                Privilege.privilege_name,
+                Privilege.description.label('privilege_description')
+            ]).select_from(
+                roles.join(Role, roles.c.role_id == Role.role_id).outerjoin(
+                    privileges, privileges.c.role_id == Role.role_id
+                ).outerjoin(Privilege, and_(
+                    privileges.c.privilege_id == Privilege.privilege_id,
+                    Privilege.valid == 1))
+            ).where(roles.c.user_id.in_(batch))
+            db_exec = db.session.execute(q)
+            rest = db_exec.fetchall()
+            db_exec.close()
+            found = dict(
+                (x, {'role': list(), 'privilege': list()}) for x in batch)
+            seen = set()
+            for row in rest:
+                info = found[row.user_id]
+                # privileges of invalid roles count as well, as ever
+                if row.valid == 1 and \
+                        (row.user_id, row.role_id) not in seen:
+                    seen.add((row.user_id, row.role_id))
+                    info['role'].append({
+                        'name': row.role_name,
+                        'description': row.description})
+                if row.privilege_name is not None:
+                    info['privilege'].append({
+                        'name': row.privilege_name,
+                        'description': row.privilege_description})
+            for user_id, info in found.items():
+                user_privileges.set(user_id, info)
+            resolved.update(found)
+        return resolved
+
+    @staticmethod
+    def getDictInfoList(users):
+        """
+        infos of users, with their roles and privileges resolved at once.
+        """
+        resolved = User.resolvePrivileges([x.user_id for x in users])
+        return [x.getDictInfo(resolved[x.user_id]) for x in users]
+
+    def getDictInfo(self, resolved=None):
+        if resolved is None:
+            resolved = User.resolvePrivileges([self.user_id])[self.user_id]
+        priv_list = resolved['privilege']
+        role_list = resolved['role']
         user_info = {
             "username": self.username,
             "user_id": self.user_id,
@@ -133,6 +236,9 @@ class User(db.Model):
         return user_info
 
     def getPrivilegeList(self, valid=1):
+        if valid == 1:
+            return User.resolvePrivileges(
+                [self.user_id])[self.user_id]['privilege']
         q = sql.select(
             [Privilege.privilege_name, Privilege.description]).where(
             and_(
@@ -151,22 +257,12 @@ class User(db.Model):
         return priv_list
 
     def getPrivilegeNameList(self, valid=1):
-        q = sql.select(
-            [Privilege.privilege_name]).where(
-            and_(
-                roles.c.user_id == self.user_id,
-                roles.c.role_id == privileges.c.role_id,
-                privileges.c.privilege_id == Privilege.privilege_id,
-                Privilege.valid == 1))
-        db_exec = db.session.execute(q)
-        rest = db_exec.fetchall()
-        db_exec.close()
-        priv_list = list()
-        for priv in rest:
-            priv_list.append(priv.privilege_name)
-        return priv_list
+        return [x['name'] for x in self.getPrivilegeList()]
 
     def getRoleList(self, valid=1):
+        if valid == 1:
+            return User.resolvePrivileges(
+                [self.user_id])[self.user_id]['role']
         q = sql.select([Role.role_name, Role.description]).where(
             and_(
                 roles.c.user_id == self.user_id,
@@ -266,6 +362,7 @@ class Role(db.Model):
             msg = utils.logmsg('exception: %s.' % e)
             app.logger.info(msg)
             state = False
+        user_privileges.clear()
         return [state, msg]
 
     def update(
@@ -376,6 +473,7 @@ class Privilege(db.Model):
             msg = utils.logmsg('exception: %s.' % e)
             app.logger.info(msg)
             state = False
+        user_privileges.clear()
         return [state, msg]
 
     def update(self, description=None, valid=None):
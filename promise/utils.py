@@ -8,6 +8,9 @@
 # holding some useful tools, and setting up the Eceptions
 #
 import uuid
+import time
+import threading
+from collections import OrderedDict
 from . import app, api
 from flask import request, make_response, json
 
@@ -22,6 +25,126 @@ def genUuid(seq):
     newUuid = uuid.uuid1().hex + uuid.uuid3(uuid.NAMESPACE_DNS, seq).hex
     return newUuid
 
+
+def genUuids(seq, count):
+    """
+        generate 'count' 64Byte uuid codes at once, cheaper than calling
+        genUuid for each of them: they share the timestamp and the hash
+        of 'seq', and differ in the last 8Byte, a serial number.
+        it is used to create 'Trail.trail_id' of a walker
+    """
+    prefix = uuid.uuid1().hex + uuid.uuid3(uuid.NAMESPACE_DNS, seq).hex[:24]
+    return [prefix + '%08x' % x for x in xrange(count)]
+
+
+class TTLCache(object):
+    """
+        a thread-safe cache keeping at most 'size' items,
+        each one for 'ttl' seconds at most. the least recently used
+        item is dropped when it is full. size of 0 disables the cache.
+    """
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+        # key -> event set once the thread loading the key is done
+        self.loading = {}
+        # changed by pop and clear, so values loaded before are dropped
+        self.generation = 0
+
+    def get(self, key, default=None):
+        with self.lock:
+            item = self.items.pop(key, None)
+            if item is None or item[0] <= time.time():
+                return default
+            self.items[key] = item
+            return item[1]
+
+    def set(self, key, value, ttl=None):
+        if not self.size:
+            return
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        with self.lock:
+            self._set(key, value, ttl)
+
+    def _set(self, key, value, ttl):
+        self.items.pop(key, None)
+        self.items[key] = (time.time() + ttl, value)
+        while len(self.items) > self.size:
+            self.items.popitem(last=False)
+
+    def pop(self, key):
+        with self.lock:
+            self.generation += 1
+            item = self.items.pop(key, None)
+        return item[1] if item else None
+
+    def clear(self):
+        with self.lock:
+            self.generation += 1
+            self.items.clear()
+
+    def load(self, key, loader, stale=0):
+        """
+            read-through get: on a miss only one thread calls loader()
+            and caches its value, the others asking for the key meanwhile
+            wait for it and get its value, or its exception if it failed.
+            with stale, a value expired for less than stale seconds is
+            returned at once and refreshed by a thread in the background.
+        """
+        if not self.size:
+            return loader()
+        with self.lock:
+            now = time.time()
+            item = self.items.get(key)
+            if item is not None and item[0] > now:
+                self.items[key] = self.items.pop(key)
+                return item[1]
+            if item is not None and item[0] + stale <= now:
+                item = None
+            event = self.loading.get(key)
+            loading = event is None
+            if loading:
+                event = self.loading[key] = threading.Event()
+                event.value = event.error = None
+            generation = self.generation
+        if item is not None:
+            if loading:
+                thread = threading.Thread(
+                    target=self._refresh,
+                    args=(key, loader, event, generation))
+                thread.daemon = True
+                thread.start()
+            return item[1]
+        if loading:
+            return self._load(key, loader, event, generation)
+        event.wait()
+        if event.error is not None:
+            raise event.error
+        return event.value
+
+    def _load(self, key, loader, event, generation):
+        try:
+            value = event.value = loader()
+            with self.lock:
+                if generation == self.generation:
+                    self._set(key, value, self.ttl)
+            return value
+        except Exception, e:
+            event.error = e
+            raise
+        finally:
+            with self.lock:
+                self.loading.pop(key, None)
+            event.set()
+
+    def _refresh(self, key, loader, event, generation):
+        try:
+            self._load(key, loader, event, generation)
+        except Exception, e:
+            app.logger.warning(logmsg('cache refresh failed: %s.' % e))
+
 """
     logger
 """
@@ -12,7 +12,7 @@ from .scriptWalker import ScriptWalkerAPI
 from .script import ScriptAPI
 from .forwardWalker import ForwardWalkerAPI
 # , PbWalkerAPI, ScriptWalkerAPI
-from .walker import WalkerAPI
+from .walker import WalkerAPI, WalkerSchedulerAPI, TrailOutputAPI
 from .. import api
 
 api.add_resource(
@@ -27,3 +27,8 @@ api.add_resource(
     ScriptWalkerAPI, '/api/v0.0/scriptwalker', endpoint='scriptwalker')
 api.add_resource(
     WalkerAPI, '/api/v0.0/walker', endpoint='walker')
+api.add_resource(
+    WalkerSchedulerAPI, '/api/v0.0/walkerscheduler',
+    endpoint='walkerscheduler')
+api.add_resource(
+    TrailOutputAPI, '/api/v0.0/trailoutput', endpoint='trailoutput')
@@ -0,0 +1,142 @@
+# -*- coding:utf-8 -*-
+# !/usr/bin/env python
+#
+# Author: Shawn.T
+# Email: shawntai.ds@gmail.com
+#
+# This is the executor module of walker package,
+# running walker executors in background threads, so that the http
+# request which establishes a walker returns at once.
+# the number of walkers running at the same time is limited,
+# the others wait in a queue:
+# * users with fewer running missions go first, so one user's burst of
+#   walkers cannot hold up the others, whatever priority it asks for,
+# * among them missions with a higher priority run first,
+# * otherwise missions run in FIFO order.
+#
+
+from .models import Walker
+from .. import app, db, utils
+import threading
+import itertools
+import heapq
+
+
+class WalkerScheduler(object):
+    """
+    a process-wide scheduler running walker missions with bounded threads.
+    """
+    def __init__(self, size):
+        self.size = size
+        self.threads = []
+        self.condition = threading.Condition()
+        # missions waiting of each user: owner_id -> heap of missions
+        self.waiting = {}
+        # number of missions running of each user
+        self.running = {}
+        # the order users are served in, for round robin among users
+        self.served = {}
+        self.counter = itertools.count()
+
+    def submit(self, walker_id, owner_id, fn, args=(), priority=0):
+        """
+        queue a mission of the walker, fn(*args) will be called
+        in one of the threads of the scheduler.
+        return the number of missions waiting in the queue.
+        """
+        self.start()
+        with self.condition:
+            heapq.heappush(
+                self.waiting.setdefault(owner_id, []),
+                (-priority, next(self.counter), walker_id, fn, args))
+            self.condition.notify()
+            queued = self.queued()
+        msg = 'walker<id:' + walker_id + '> queued, %d waiting.' % queued
+        app.logger.debug(utils.logmsg(msg))
+        return queued
+
+    def queued(self):
+        return sum(len(x) for x in self.waiting.values())
+
+    def stats(self):
+        """
+        queue depth and running count of the scheduler.
+        """
+        with self.condition:
+            return {
+                'size': self.size,
+                'queued': self.queued(),
+                'running': sum(self.running.values())}
+
+    def start(self):
+        # threads are started at the first submit
+        with self.condition:
+            while len(self.threads) < self.size:
+                thread = threading.Thread(target=self.work)
+                thread.daemon = True
+                thread.start()
+                self.threads.append(thread)
+
+    def next(self):
+        # pick the mission to run next, wait if there is none
+        with self.condition:
+            while not self.waiting:
+                self.condition.wait()
+            owner_id = min(self.waiting, key=lambda x: (
+                self.running.get(x, 0), self.waiting[x][0][0],
+                self.served.get(x, -1)))
+            mission = heapq.heappop(self.waiting[owner_id])
+            if not self.waiting[owner_id]:
+                del self.waiting[owner_id]
+            self.running[owner_id] = self.running.get(owner_id, 0) + 1
+            self.served[owner_id] = next(self.counter)
+            return [owner_id] + list(mission[2:])
+
+    def recover(self):
+        """
+        missions queued or running are lost when the process exits,
+        mark their walkers left in the database as faild to start.
+        other backends may be running walkers in the same database, so it
+        is run by 'manager.py recoverwalkers' while all of them are down.
+        """
+        try:
+            count = Walker.query.filter(Walker.state.in_([-2, -1])).update(
+                {'state': -4}, synchronize_session=False)
+            db.session.commit()
+        except Exception, e:
+            db.session.rollback()
+            msg = 'faild to recover walkers: %s.' % e
+            app.logger.warning(utils.logmsg(msg))
+            return
+        if count:
+            msg = '%d walkers left by the last run marked faild.' % count
+            app.logger.warning(utils.logmsg(msg))
+
+    def done(self, owner_id):
+        with self.condition:
+            self.running[owner_id] -= 1
+            if not self.running[owner_id]:
+                del self.running[owner_id]
+
+    def work(self):
+        while True:
+            [owner_id, walker_id, fn, args] = self.next()
+            with app.app_context():
+                try:
+                    fn(*args)
+                except Exception, e:
+                    msg = 'walker<id:' + walker_id + \
+                        '> faild to run: %s.' % e
+                    app.logger.warning(utils.logmsg(msg))
+                    db.session.rollback()
+                    walker = Walker.query.filter_by(
+                        walker_id=walker_id).first()
+                    if walker:
+                        walker.state = -4
+                        walker.save()
+                finally:
+                    db.session.remove()
+                    self.done(owner_id)
+
+
+scheduler = WalkerScheduler(app.config['WALKER_MAX_RUNNING'])
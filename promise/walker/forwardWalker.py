@@ -7,8 +7,8 @@
 #
 
 from flask import g
-from flask_restful import reqparse, Resource
-from .models import Walker, ForwardMission, Script
+from flask_restful import reqparse, Resource, inputs
+from .models import Walker, TrailWriter, ForwardMission, Script
 from . import utils as walkerUtils
 from .. import app
 from forward.api import Forward
@@ -18,6 +18,7 @@ from ..user import auth
 # import threading
 # import thread
 from .. import dont_cache
+from .executor import scheduler
 from tempfile import NamedTemporaryFile
 import os
 import json
@@ -38,17 +39,16 @@ class ForwardWalkerAPI(Resource):
     @auth.PrivilegeAuth(privilegeRequired="forwardExec")
     def post(self):
         # check the arguments
-        [iplist, script, os_user, params, walker_name, inventory] = \
-            self.argCheckForPost()
-        # setup a walker
+        [iplist, script, os_user, params, walker_name, inventory,
+         priority] = self.argCheckForPost()
+        # setup a walker and a forwardmission linked to it,
+        # they are saved with the trails at once
         walker = Walker(walker_name)
-
-        [msg, trails] = walker.establish(iplist, g.current_user)
-        # setup a scriptmission and link to the walker
         forward_mission = ForwardMission(script, os_user, params, walker)
-        forward_mission.save()
-        walker.state = -1
-        walker.save()
+        [msg, trails] = walker.establish(
+            iplist, g.current_user, forward_mission)
+        if trails is None:
+            raise utils.InvalidAPIUsage(msg, 500)
 #        # setup a shell mission walker executor thread#
 
 #        try:
@@ -65,11 +65,12 @@ class ForwardWalkerAPI(Resource):
 #            walker.save()
 #            return {'message': msg, 'walker_id': walker.walker_id}, 200
 
-        forward_walker_executor = ForwardWalkerExecutor(
-            forward_mission, inventory)
-        # run the executor thread
-        # script_walker_executor.start()
-        forward_walker_executor.run()
+        # run the executor in background, the walker waits in the queue
+        # until the executor pool is available
+        scheduler.submit(
+            walker.walker_id, g.current_user.user_id,
+            ForwardWalkerExecutor.runMission,
+            (forward_mission.forwardmission_id, inventory), priority)
 
         msg = 'target forward execution established!'
         return {'message': msg, 'walker_id': walker.walker_id}, 200
@@ -80,18 +81,20 @@ class ForwardWalkerAPI(Resource):
     @auth.PrivilegeAuth(privilegeRequired="scriptExec")
     @dont_cache()
     def get(self):
-        walker_id = self.argCheckForGet()
+        [walker_id, summary] = self.argCheckForGet()
         if not walker_id:
             [msg, json_walkers] = self.getWalkerListOfTokenOwner()
             return {'message': msg, 'walkers': json_walkers}, 200
         else:
-            [msg, walker_name, state, stdout, json_trails] = \
-                self.getWalkerInfoOfTokenOwner(walker_id)
+            [msg, walker_name, state, forward_mission, json_trails] = \
+                self.getWalkerInfoOfTokenOwner(walker_id, summary)
             return {
                 'message': msg,
                 'walker_name': walker_name,
                 'state': state,
-                'stdout': stdout,
+                'stdout': forward_mission.stdout,
+                'stdout_length': forward_mission.stdout_length,
+                'stdout_digest': forward_mission.stdout_digest,
                 'trails': json_trails}, 200
 
     """
@@ -113,6 +116,9 @@ class ForwardWalkerAPI(Resource):
         self.reqparse.add_argument(
             'name', type=str, location='json',
             help='default walker-name: time-scriptname')
+        self.reqparse.add_argument(
+            'priority', type=int, location='json', default=0,
+            help='priority must be an integer')
 
         args = self.reqparse.parse_args()
         iplist = args['iplist']
@@ -125,7 +131,7 @@ class ForwardWalkerAPI(Resource):
         params = args['params']
         os_user = args['osuser']
 
-        inventory = eaterIf.toForward(iplist)
+        inventory = eaterIf.to_forward(iplist)
         if not inventory:
             msg = 'cant find inventory info from eater.'
             app.logger.warning(utils.logmsg(msg))
@@ -143,6 +149,7 @@ class ForwardWalkerAPI(Resource):
 #            inventory.append(target)
 
         walker_name = args['name']
+        priority = args['priority']
 
         # check if the script belongs to the current user
         script = Script.getFromIdWithinUserOrPublic(
@@ -164,17 +171,22 @@ class ForwardWalkerAPI(Resource):
             params = params
         else:
             params = None
-        return [iplist, script, os_user, params, walker_name, inventory]
+        return [
+            iplist, script, os_user, params, walker_name, inventory,
+            priority]
 
     def argCheckForGet(self):
         self.reqparse.add_argument(
             'walkerid', type=str,
             location='args', help='walker id must be a string')
+        self.reqparse.add_argument(
+            'summary', type=inputs.boolean, location='args', default=False,
+            help='summary must be boolean')
         args = self.reqparse.parse_args()
         walker_id = args['walkerid']
         if not walker_id:
             walker_id = None
-        return walker_id
+        return [walker_id, args['summary']]
 
     @staticmethod
     def getWalkerListOfTokenOwner():
@@ -184,7 +196,7 @@ class ForwardWalkerAPI(Resource):
         return [msg, json_walkers]
 
     @staticmethod
-    def getWalkerInfoOfTokenOwner(walker_id):
+    def getWalkerInfoOfTokenOwner(walker_id, summary=False):
         [walker, json_walker] = Walker.getFromWalkerIdWithinUser(
             walker_id, g.current_user)
         if not walker:
@@ -194,9 +206,9 @@ class ForwardWalkerAPI(Resource):
         if not forward_mission:
             msg = 'this is not a forward mission.'
             raise utils.InvalidAPIUsage(msg)
-        [trails, json_trails] = walker.getTrails()
+        [trails, json_trails] = walker.getTrails(summary)
         msg = 'walker info'
-        return [msg, walker.walker_name, walker.state, forward_mission.stdout,
+        return [msg, walker.walker_name, walker.state, forward_mission,
                 json_trails]
 
 #    @staticmethod
@@ -213,8 +225,8 @@ class ForwardWalkerExecutor(Resource):
         self.forward_mission = forward_mission
         self.walker = forward_mission.getWalker()
         self.script = forward_mission.getScript()
-        [trails, json_trails] = forward_mission.getTrails()
-        self.trails = trails
+        # results of hosts are written in bulk
+        self.writer = TrailWriter(self.walker)
         self.owner = self.walker.getOwner()
         self.hostnames = forward_mission.getIplist()
         self.remote_user = forward_mission.osuser
@@ -234,10 +246,20 @@ class ForwardWalkerExecutor(Resource):
         script_file.close()
         return script_file
 
+    @staticmethod
+    def runMission(forwardmission_id, inventory):
+        forward_mission = ForwardMission.query.filter_by(
+            forwardmission_id=forwardmission_id).first()
+        forward_walker_executor = ForwardWalkerExecutor(
+            forward_mission, inventory)
+        forward_walker_executor.run()
+
     def run(self):
         msg = 'forward walker<id:' + self.walker.walker_id + '> begin to run.'
         app.logger.info(utils.logmsg(msg))
         print self.script_file.name
+        self.walker.state = -1
+        self.walker.save()
 
         try:
             results = self.forward.run()
@@ -246,9 +268,10 @@ class ForwardWalkerExecutor(Resource):
             msg = 'forward %s' % e
             msg = msg + 'tmp file name ' + self.script_file.name
             app.logger.warning(utils.logmsg(msg))
+            # nobody is waiting for the walker, just mark it
             self.walker.state = 1
             self.walker.save()
-            raise utils.InvalidAPIUsage(msg)
+            return
 #        except:
 #            msg = "unknown Forward Error"
 #            app.logger.info(utils.logmsg(msg))#
@@ -256,10 +279,10 @@ class ForwardWalkerExecutor(Resource):
 #        # threadLock.acquire()
         # count for the state of walker: num of failures and unreachable
         walker_state = 0
-        for trail in self.trails:
+        for ip in self.hostnames:
             host_stat_sum = dict(
                 ok=0, failures=0, unreachable=0, changed=0, skipped=0)
-            host_status = results['status'][trail.ip]
+            host_status = results['status'][ip]
             for stat in host_status:
                 if host_status[stat] == 'ok':
                     host_stat_sum['ok'] += 1
@@ -272,19 +295,21 @@ class ForwardWalkerExecutor(Resource):
                 elif host_status[stat] == 'changed':
                     host_stat_sum['changed'] += 1
             host_result = dict(
-                msg=json.dumps(results['status'][trail.ip]))
+                msg=json.dumps(results['status'][ip]))
 
-            trail.resultUpdate(host_stat_sum, host_result)
-            trail.save()
+            self.writer.add(ip, host_stat_sum, host_result)
 
             walker_state = walker_state + host_stat_sum['failures'] + \
                 host_stat_sum['unreachable']
         stdout = json.dumps(results['stdout'])
         print 'stdout:' + stdout
-        self.forward_mission.stdout = unicode(stdout, 'ascii').encode('utf-8')
-        self.forward_mission.save()
-        self.walker.state = walker_state
-        self.walker.save()
+        [summary, length, digest] = self.writer.pack(stdout)
+        self.writer.update(
+            self.forward_mission, stdout=summary, stdout_length=length,
+            stdout_digest=digest)
+        # the stdout of the mission is committed with the rest of the trails
+        # and the walker state
+        self.writer.close(walker_state)
         # threadLock.release()
 
         msg = 'walker<id:' + self.walker.walker_id + \
@@ -12,9 +12,15 @@ from .. import db, app
 from .. import utils, ma
 # from ..ansiAdapter import ShellExecAdapter
 from ..user.models import User
-from sqlalchemy import and_, or_
+from sqlalchemy import and_, or_, bindparam
+from sqlalchemy.orm import defer
 import datetime
-from sqlalchemy.dialects.mysql import LONGTEXT
+import hashlib
+import zlib
+from sqlalchemy.dialects.mysql import LONGBLOB, LONGTEXT
+
+# max number of keys in one IN clause
+BATCH_SIZE = 500
 
 
 class Walker(db.Model):
@@ -42,7 +48,7 @@ class Walker(db.Model):
     #  0: all success
     # >0: num of faild tasks
     # -3: timeout
-    # -4: faild to start
+    # -4: faild to start, or to save its trails
     state = db.Column(db.Integer)
 
     def __repr__(self):
@@ -67,44 +73,48 @@ class Walker(db.Model):
             state = False
         return [state, msg]
 
-    def establish(self, iplist, owner):
-        # establish the walker
+    def establish(self, iplist, owner, mission=None):
+        """
+        establish the walker with its trails (one target ip with one trail)
+        and its mission in one transaction.
+        return [msg, ids of the trails], or [msg, None] if faild.
+        """
         self.owner_id = owner.user_id
-        self.state = -1
-        # establish trails(one target ip with one trail)
-        trail_list = []
-        for ip in iplist:
-            trail = Trail(ip)
-            trail.save()
-            trail_list.append(trail)
-
-        [msg, state] = self.addTrailList(trail_list)
-        if state is not 0:
-            return [msg, None]
-#                msg = 'walker' + self.walker_id + ' establish faild.'
-#                app.logger.warning(utils.logmsg(msg))
-#                return [msg, None]
-        self.save()
-        msg = 'walker' + self.walker_id + ' established'
-        app.logger.debug(utils.logmsg(msg))
-        return [msg, self.trails.all()]
-
-    def addTrailList(self, trail_list):
-        self.trails = trail_list
+        self.state = -2
+        trail_ids = utils.genUuids(str(self.walker_id), len(iplist))
+        rows = [dict(trail_id=x, ip=y, walker_id=self.walker_id)
+                for x, y in zip(trail_ids, iplist)]
+        chunk = app.config['WALKER_BULK_CHUNK']
         try:
             db.session.add(self)
+            db.session.flush()
+            # trails are inserted by executemany, in chunks
+            for i in range(0, len(rows), chunk):
+                db.session.execute(
+                    Trail.__table__.insert(), rows[i:i + chunk],
+                    mapper=Trail.__mapper__)
+            if mission is not None:
+                db.session.add(mission)
             db.session.commit()
-        except:
-            msg = 'add trail faild.'
-            app.logger.debug(utils.logmsg(msg))
-            return [msg, 1]
-        msg = 'add trails success.'
+        except Exception, e:
+            db.session.rollback()
+            msg = 'walker<id:' + self.walker_id + \
+                '> faild to establish: %s.' % e
+            app.logger.warning(utils.logmsg(msg))
+            return [msg, None]
+        msg = 'walker' + self.walker_id + ' established'
         app.logger.debug(utils.logmsg(msg))
-        return [msg, 0]
-
-    def getTrails(self):
-        trails = self.trails.all()
-        json_trails = trails_schema.dump(trails).data
+        return [msg, trail_ids]
+
+    def getTrails(self, summary=False):
+        # outputs of the trails are left out if only the summary is asked
+        if summary:
+            trails = self.trails.options(
+                defer('msg'), defer('stdout'), defer('stderr')).all()
+            json_trails = trail_summaries_schema.dump(trails).data
+        else:
+            trails = self.trails.all()
+            json_trails = trails_schema.dump(trails).data
         return [trails, json_trails]
 
     def getTrailFromIp(self):
@@ -316,7 +326,12 @@ class ForwardMission(db.Model):
     walker_id = db.Column(db.String(64), db.ForeignKey('walker.walker_id'))
     # run the script as this user on the target equipment
     osuser = db.Column(db.String(64))
+    # summary of the stdout, its length (in bytes) and the digest of
+    # the whole of it in the output store, see Output. missions run before
+    # the output store keep the whole stdout here
     stdout = db.Column(LONGTEXT)
+    stdout_length = db.Column(db.Integer)
+    stdout_digest = db.Column(db.String(40))
     # walker = db.relationship()
 
     def __repr__(self):
@@ -369,6 +384,21 @@ class ForwardMission(db.Model):
             iplist.append(trail.ip)
         return iplist
 
+    @staticmethod
+    def getFromIdWithinUser(forwardmission_id, user, valid=1):
+        forward_mission = ForwardMission.query.join(Walker).filter(and_(
+            ForwardMission.forwardmission_id == forwardmission_id,
+            Walker.owner_id == user.user_id,
+            Walker.valid == valid)).first()
+        return forward_mission
+
+    def readOutput(self, key='stdout', offset=0, limit=None):
+        """
+        read the stdout of the forward mission from the byte offset,
+        limit bytes at most, return an iterator of its pieces.
+        """
+        return Output.read(self, key, offset, limit)
+
 
 class Script(db.Model):
     '''
@@ -514,8 +544,15 @@ class Trail(db.Model):
     __tablename__ = 'trail'
     trail_id = db.Column(db.String(64), primary_key=True)
     ip = db.Column(db.String(15))
+    # summaries of the outputs, their lengths (in bytes) and the digests of
+    # the whole of them in the output store, see Output. trails written
+    # before the output store keep the whole outputs here
     stdout = db.Column(LONGTEXT)
+    stdout_length = db.Column(db.Integer)
+    stdout_digest = db.Column(db.String(40))
     stderr = db.Column(LONGTEXT)
+    stderr_length = db.Column(db.Integer)
+    stderr_digest = db.Column(db.String(40))
     msg = db.Column(db.Text)
     time_start = db.Column(db.DATETIME)
     time_end = db.Column(db.DATETIME)
@@ -540,28 +577,54 @@ class Trail(db.Model):
         self.stdout = stdout
         self.state = state
 
-    def resultUpdate(self, stat_sum, result):
-        # update the status sum
-        self.sum_ok = stat_sum['ok']
-        self.sum_unreachable = stat_sum['unreachable']
-        self.sum_skipped = stat_sum['skipped']
-        self.sum_changed = stat_sum['changed']
-        self.sum_failures = stat_sum['failures']
-        # update the result
+    @staticmethod
+    def resultValues(stat_sum, result, blobs):
+        # column values of a trail from the result of its host,
+        # outputs to be stored are put into blobs
+        # the status sum
+        values = dict(
+            sum_ok=stat_sum['ok'],
+            sum_unreachable=stat_sum['unreachable'],
+            sum_skipped=stat_sum['skipped'],
+            sum_changed=stat_sum['changed'],
+            sum_failures=stat_sum['failures'])
+        # the result
         if 'msg' in result:
-            self.msg = result['msg']
-        if 'stdout' in result:
-            self.stdout = result['stdout']
-        if 'stderr' in result:
-            self.stderr = result['stderr']
+            values['msg'] = result['msg']
+        for key in ('stdout', 'stderr'):
+            if key in result:
+                [values[key], values[key + '_length'],
+                 values[key + '_digest']] = Output.pack(result[key], blobs)
         if 'delta' in result:
-            self.time_delta_string = result['delta']
+            values['time_delta_string'] = result['delta']
         if 'start' in result:
-            self.time_start = datetime.datetime.strptime(
+            values['time_start'] = datetime.datetime.strptime(
                 result['start'], "%Y-%m-%d %H:%M:%S.%f")
         if 'end' in result:
-            self.time_end = datetime.datetime.strptime(
+            values['time_end'] = datetime.datetime.strptime(
                 result['end'], "%Y-%m-%d %H:%M:%S.%f")
+        return values
+
+    @staticmethod
+    def getFromTrailIdWithinUser(trail_id, user, valid=1):
+        trail = Trail.query.join(Walker).filter(and_(
+            Trail.trail_id == trail_id,
+            Walker.owner_id == user.user_id,
+            Walker.valid == valid)).first()
+        return trail
+
+    def readOutput(self, key='stdout', offset=0, limit=None):
+        """
+        read an output (stdout or stderr) of the trail from the byte offset,
+        limit bytes at most, return an iterator of its pieces.
+        """
+        return Output.read(self, key, offset, limit)
+
+    def resultUpdate(self, stat_sum, result):
+        blobs = {}
+        for k, w in Trail.resultValues(stat_sum, result, blobs).items():
+            setattr(self, k, w)
+        Output.store(blobs)
 
     def save(self):
         db.session.add(self)
@@ -593,6 +656,213 @@ class Trail(db.Model):
         return [state, msg]
 
 
+class Output(db.Model):
+    '''
+    the output store: outputs too long to be kept by trails are compressed
+    and stored here, once for all the trails sharing the same output.
+    '''
+    __tablename__ = 'output'
+    # sha1 of the output
+    digest = db.Column(db.String(40), primary_key=True)
+    # length of the output (in bytes)
+    length = db.Column(db.Integer)
+    # the output compressed by zlib
+    data = db.Column(db.LargeBinary().with_variant(LONGBLOB, 'mysql'))
+
+    def __repr__(self):
+        return '<output %r>' % self.digest
+
+    @staticmethod
+    def pack(text, blobs):
+        """
+        cut an output to the summary kept by its owner.
+        return [summary, length, digest], the digest is None if the summary
+        is the whole output, otherwise the compressed output is put into
+        blobs (digest -> [length, data]) to be stored.
+        """
+        if text is None:
+            return [None, None, None]
+        if not isinstance(text, unicode):
+            text = text.decode('utf-8', 'replace')
+        raw = text.encode('utf-8')
+        size = app.config['WALKER_OUTPUT_SUMMARY']
+        if len(text) <= size:
+            return [text, len(raw), None]
+        digest = hashlib.sha1(raw).hexdigest()
+        if digest not in blobs:
+            blobs[digest] = [len(raw), zlib.compress(raw)]
+        return [text[:size], len(raw), digest]
+
+    @staticmethod
+    def store(blobs):
+        """
+        store the compressed outputs of blobs which are not stored yet,
+        in the current transaction, the caller commits.
+        """
+        digests = blobs.keys()
+        exist = set()
+        for i in range(0, len(digests), BATCH_SIZE):
+            exist.update(x for x, in db.session.query(Output.digest).filter(
+                Output.digest.in_(digests[i:i + BATCH_SIZE])))
+        rows = [dict(digest=k, length=w[0], data=w[1])
+                for k, w in blobs.items() if k not in exist]
+        if rows:
+            # the same output may be stored by another walker meanwhile
+            db.session.execute(
+                Output.__table__.insert().prefix_with(
+                    'IGNORE', dialect='mysql'),
+                rows, mapper=Output.__mapper__)
+
+    @staticmethod
+    def iterate(data, offset=0, limit=None, size=65536):
+        """
+        decompress an output piece by piece, no more than size bytes
+        at a time, yielding the bytes from offset, limit bytes at most.
+        """
+        end = None if limit is None else offset + limit
+        decompressor = zlib.decompressobj()
+        position = 0
+        while data and (end is None or position < end):
+            piece = decompressor.decompress(data, size)
+            data = decompressor.unconsumed_tail
+            if not data:
+                piece += decompressor.flush()
+            start = max(offset - position, 0)
+            stop = len(piece) if end is None else \
+                min(end - position, len(piece))
+            position += len(piece)
+            if start < stop:
+                yield piece[start:stop]
+
+    @staticmethod
+    def read(owner, key, offset=0, limit=None):
+        """
+        read the output key of its owner (a trail or a forward mission)
+        from the byte offset, limit bytes at most, return an iterator of
+        its pieces.
+        """
+        digest = getattr(owner, key + '_digest')
+        if digest:
+            output = Output.query.filter_by(digest=digest).first()
+            if output is not None:
+                return Output.iterate(output.data, offset, limit)
+        # the summary is the whole output
+        raw = (getattr(owner, key) or u'').encode('utf-8')
+        raw = raw[offset:] if limit is None else raw[offset:offset + limit]
+        return iter([raw] if raw else [])
+
+
+class TrailWriter(object):
+    '''
+    writes the results of the trails of a walker in bulk:
+    results are buffered, and written by executemany with one commit
+    per chunk, the state of the walker goes with the last chunk.
+    '''
+    columns = (
+        'msg', 'stdout', 'stdout_length', 'stdout_digest', 'stderr',
+        'stderr_length', 'stderr_digest', 'time_start', 'time_end',
+        'time_delta_string', 'sum_ok', 'sum_unreachable', 'sum_skipped',
+        'sum_changed', 'sum_failures')
+
+    def __init__(self, walker, chunk=None):
+        self.walker = walker
+        # the walker is expired by a failed write, keep its id at hand
+        self.walker_id = walker.walker_id
+        self.chunk = chunk or app.config['WALKER_BULK_CHUNK']
+        # number of buffered results to write at, grows while writes fail
+        self.size = self.chunk
+        self.rows = []
+        # outputs to be stored with the buffered results
+        self.blobs = {}
+        # objects to be saved with the buffered results, with their values
+        self.objects = []
+        # trails of a host are found by the ip, not loaded at all
+        self.statement = Trail.__table__.update().where(and_(
+            Trail.walker_id == bindparam('b_walker_id'),
+            Trail.ip == bindparam('b_ip')))
+
+    def add(self, ip, stat_sum, result):
+        # buffer the result of a host, write the buffer once it is full
+        row = dict.fromkeys(self.columns)
+        row.update(Trail.resultValues(stat_sum, result, self.blobs))
+        row.update(b_walker_id=self.walker_id, b_ip=ip)
+        self.rows.append(row)
+        if len(self.rows) >= self.size:
+            return self.flush()
+        return [True, None]
+
+    def pack(self, text):
+        # cut an output to its summary, the whole of it is stored with
+        # the buffered results
+        return Output.pack(text, self.blobs)
+
+    def update(self, obj, **values):
+        # change an object, it is saved with the buffered results
+        self.objects.append((obj, values))
+
+    def write(self):
+        Output.store(self.blobs)
+        if self.rows:
+            db.session.execute(
+                self.statement, self.rows, mapper=Trail.__mapper__)
+        for obj, values in self.objects:
+            for key, value in values.items():
+                setattr(obj, key, value)
+            db.session.add(obj)
+        db.session.commit()
+
+    def flush(self, walker_state=None):
+        # write the buffered results, and the state of the walker if given,
+        # the buffer is kept to be written later if it fails
+        if walker_state is not None:
+            self.update(self.walker, state=walker_state)
+        try:
+            self.write()
+            state = True
+        except Exception, e:
+            db.session.rollback()
+            msg = utils.logmsg('exception: %s.' % e)
+            app.logger.info(msg)
+            state = False
+
+            # close db.session, reconnect and try again
+            db.session.close()
+            try:
+                self.write()
+                state = True
+            except Exception, e:
+                db.session.rollback()
+                msg = utils.logmsg('exception: %s.' % e)
+                app.logger.info(msg)
+                state = False
+        if state:
+            msg = utils.logmsg('save %d trails of walker:%s' % (
+                len(self.rows), self.walker_id))
+            app.logger.debug(msg)
+            self.rows, self.blobs, self.objects = [], {}, []
+            self.size = self.chunk
+        else:
+            # try again once another chunk is buffered
+            self.size = len(self.rows) + self.chunk
+        return [state, msg]
+
+    def close(self, walker_state):
+        # write the rest of the results with the state of the walker,
+        # mark the walker faild on its own if they can not be written
+        [state, msg] = self.flush(walker_state)
+        if state:
+            return [state, msg]
+        try:
+            Walker.query.filter_by(walker_id=self.walker_id).update(
+                {'state': -4}, synchronize_session=False)
+            db.session.commit()
+        except Exception, e:
+            db.session.rollback()
+            app.logger.warning(utils.logmsg(
+                'faild to mark walker:%s faild: %s.' % (self.walker_id, e)))
+        return [state, msg]
+
+
 #####################################################################
 #    establish a meta data class for data print                     #
 #####################################################################
@@ -616,11 +886,27 @@ class TrailSchema(ma.ModelSchema):
         fields = [
             'trail_id', 'ip', 'sum_ok', 'sum_unreachable',
             'sum_skipped', 'sum_changed', 'sum_failures', 'msg', 'stdout',
-            'time_start', 'time_end', 'time_delta_string', 'stderr']
+            'time_start', 'time_end', 'time_delta_string', 'stderr',
+            'stdout_length', 'stdout_digest', 'stderr_length',
+            'stderr_digest']
 trail_schema = TrailSchema()
 trails_schema = TrailSchema(many=True)
 
 
+class TrailSummarySchema(ma.ModelSchema):
+    """
+        establish a meta data class for data print, without outputs
+    """
+    class Meta:
+        model = Trail
+        fields = [
+            'trail_id', 'ip', 'sum_ok', 'sum_unreachable',
+            'sum_skipped', 'sum_changed', 'sum_failures', 'time_start',
+            'time_end', 'time_delta_string', 'stdout_length',
+            'stdout_digest', 'stderr_length', 'stderr_digest']
+trail_summaries_schema = TrailSummarySchema(many=True)
+
+
 class ScriptSchema(ma.ModelSchema):
     """
         establish a meta data class for data print
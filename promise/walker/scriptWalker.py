@@ -12,8 +12,8 @@
 #
 
 from flask import g
-from flask_restful import reqparse, Resource
-from .models import Walker, ScriptMission, Script
+from flask_restful import reqparse, Resource, inputs
+from .models import Walker, TrailWriter, ScriptMission, Script
 from . import utils as walkerUtils
 from .. import app
 from ..ansiAdapter.ansiAdapter import ScriptExecAdapter
@@ -22,6 +22,7 @@ from ..user import auth
 # import threading
 # import thread
 from .. import dont_cache
+from .executor import scheduler
 
 # threadLock = threading.Lock()
 
@@ -38,16 +39,23 @@ class ScriptWalkerAPI(Resource):
     @auth.PrivilegeAuth(privilegeRequired="scriptExec")
     def post(self):
         # check the arguments
-        [iplist, script, os_user, params, walker_name] = self.argCheckForPost()
-        # setup a walker
+        [iplist, script, os_user, params, walker_name, priority,
+         run_options] = self.argCheckForPost()
+        if os_user == 'root':
+            private_key_file = app.config['ROOT_SSH_KEY_FILE']
+        elif os_user == 'admin':
+            private_key_file = app.config['ADMIN_SSH_KEY_FILE']
+        else:
+            msg = 'wrong os user.'
+            raise utils.InvalidAPIUsage(msg)
+        # setup a walker and a scriptmission linked to it,
+        # they are saved with the trails at once
         walker = Walker(walker_name)
-
-        [msg, trails] = walker.establish(iplist, g.current_user)
-        # setup a scriptmission and link to the walker
         script_mission = ScriptMission(script, os_user, params, walker)
-        script_mission.save()
-        walker.state = -1
-        walker.save()
+        [msg, trails] = walker.establish(
+            iplist, g.current_user, script_mission)
+        if trails is None:
+            raise utils.InvalidAPIUsage(msg, 500)
 #        # setup a shell mission walker executor thread#
 
 #        try:
@@ -63,20 +71,14 @@ class ScriptWalkerAPI(Resource):
 #            walker.state = -4
 #            walker.save()
 #            return {'message': msg, 'walker_id': walker.walker_id}, 200
-        if os_user == 'root':
-            private_key_file = app.config['ROOT_SSH_KEY_FILE']
-        elif os_user == 'admin':
-            private_key_file = app.config['ADMIN_SSH_KEY_FILE']
-        else:
-            msg = 'wrong os user.'
-            raise utils.InvalidAPIUsage(msg)
 
-        script_walker_executor = ScriptWalkerExecutor(
-            script_mission=script_mission,
-            private_key_file=private_key_file)
-        # run the executor thread
-        # script_walker_executor.start()
-        script_walker_executor.run()
+        # run the executor in background, the walker waits in the queue
+        # until the executor pool is available
+        scheduler.submit(
+            walker.walker_id, g.current_user.user_id,
+            ScriptWalkerExecutor.runMission,
+            (script_mission.scriptmission_id, private_key_file,
+             run_options), priority)
 
         msg = 'target script execution established!'
         return {'message': msg, 'walker_id': walker.walker_id}, 200
@@ -87,13 +89,13 @@ class ScriptWalkerAPI(Resource):
     @auth.PrivilegeAuth(privilegeRequired="scriptExec")
     @dont_cache()
     def get(self):
-        walker_id = self.argCheckForGet()
+        [walker_id, summary] = self.argCheckForGet()
         if not walker_id:
             [msg, json_walkers] = self.getWalkerListOfTokenOwner()
             return {'message': msg, 'walkers': json_walkers}, 200
         else:
             [msg, walker_name, state, json_trails] = \
-                self.getWalkerInfoOfTokenOwner(walker_id)
+                self.getWalkerInfoOfTokenOwner(walker_id, summary)
             return {
                 'message': msg,
                 'walker_name': walker_name,
@@ -119,6 +121,18 @@ class ScriptWalkerAPI(Resource):
         self.reqparse.add_argument(
             'name', type=str, location='json',
             help='default walker-name: time-scriptname')
+        self.reqparse.add_argument(
+            'priority', type=int, location='json', default=0,
+            help='priority must be an integer')
+        self.reqparse.add_argument(
+            'forks', type=inputs.positive, location='json',
+            help='forks must be a positive integer')
+        self.reqparse.add_argument(
+            'serial', type=inputs.positive, location='json',
+            help='serial must be a positive integer')
+        self.reqparse.add_argument(
+            'timeout', type=inputs.positive, location='json',
+            help='timeout must be a positive integer')
 
         args = self.reqparse.parse_args()
         iplist = args['iplist']
@@ -131,6 +145,9 @@ class ScriptWalkerAPI(Resource):
         params = args['params']
         os_user = args['osuser']
         walker_name = args['name']
+        priority = args['priority']
+        run_options = walkerUtils.ansibleRunOptions(
+            args['forks'], args['serial'], args['timeout'])
 
         # check if the script belongs to the current user
         script = Script.getFromIdWithinUserOrPublic(
@@ -149,17 +166,22 @@ class ScriptWalkerAPI(Resource):
             params = params.encode('utf-8')
         else:
             params = None
-        return [iplist, script, os_user, params, walker_name]
+        return [
+            iplist, script, os_user, params, walker_name, priority,
+            run_options]
 
     def argCheckForGet(self):
         self.reqparse.add_argument(
             'walkerid', type=str,
             location='args', help='walker id must be a string')
+        self.reqparse.add_argument(
+            'summary', type=inputs.boolean, location='args', default=False,
+            help='summary must be boolean')
         args = self.reqparse.parse_args()
         walker_id = args['walkerid']
         if not walker_id:
             walker_id = None
-        return walker_id
+        return [walker_id, args['summary']]
 
     @staticmethod
     def getWalkerListOfTokenOwner():
@@ -168,11 +190,11 @@ class ScriptWalkerAPI(Resource):
         return [msg, json_walkers]
 
     @staticmethod
-    def getWalkerInfoOfTokenOwner(walker_id):
+    def getWalkerInfoOfTokenOwner(walker_id, summary=False):
         [walker, json_walker] = Walker.getFromWalkerIdWithinUser(
             walker_id, g.current_user)
         if walker:
-            [trails, json_trails] = walker.getTrails()
+            [trails, json_trails] = walker.getTrails(summary)
             msg = 'walker info'
             return [msg, walker.walker_name, walker.state, json_trails]
         else:
@@ -189,13 +211,15 @@ class ScriptWalkerAPI(Resource):
 # class ScriptWalkerExecutor(threading.Thread):
 class ScriptWalkerExecutor(Resource):
     def __init__(self, script_mission, private_key_file='~/.ssh/id_rsa',
-                 become_pass=None):
+                 become_pass=None, run_options=None):
         # threading.Thread.__init__(self)
         self.script_mission = script_mission
         self.walker = script_mission.getWalker()
         self.script = script_mission.getScript()
-        [trails, json_trails] = script_mission.getTrails()
-        self.trails = trails
+        # results of hosts are written in bulk as hosts finish
+        self.writer = TrailWriter(self.walker)
+        # num of failures and unreachable counted as hosts finish
+        self.failures = 0
         self.owner = self.walker.getOwner()
         self.hostnames = script_mission.getIplist()
         self.remote_user = script_mission.osuser
@@ -210,22 +234,37 @@ class ScriptWalkerExecutor(Resource):
             run_data,
             become_pass,
             self.script.script_text,
-            script_mission.params)
+            script_mission.params,
+            on_result=self.onResult,
+            script_cache=app.config['WALKER_SCRIPT_CACHE'],
+            script_age=app.config['WALKER_SCRIPT_CACHE_AGE'],
+            **(run_options or {}))
+
+    @staticmethod
+    def runMission(scriptmission_id, private_key_file, run_options):
+        script_mission = ScriptMission.query.filter_by(
+            scriptmission_id=scriptmission_id).first()
+        script_walker_executor = ScriptWalkerExecutor(
+            script_mission=script_mission,
+            private_key_file=private_key_file,
+            run_options=run_options)
+        script_walker_executor.run()
+
+    def onResult(self, host, stat_sum, result):
+        # buffer the trail(s) of the host once its result arrives
+        self.writer.add(host, stat_sum, result)
+        self.failures += stat_sum['failures'] + stat_sum['unreachable']
 
     def run(self):
         msg = 'walker<id:' + self.walker.walker_id + '> begin to run.'
         app.logger.info(utils.logmsg(msg))
+        self.walker.state = -1
+        self.walker.save()
 
+        # trails are written by onResult in chunks while hosts finish,
+        # the rest of them together with the state of the walker
         [state, stats_sum, results] = self.script_exec_adpater.run()
-        # threadLock.acquire()
-        for trail in self.trails:
-            host_result = results[trail.ip]
-            host_stat_sum = stats_sum[trail.ip]
-            trail.resultUpdate(host_stat_sum, host_result)
-            trail.save()
-        self.walker.state = state
-        self.walker.save()
-        # threadLock.release()
+        self.writer.close(self.failures if self.failures else state)
 
         msg = 'walker<id:' + self.walker.walker_id + \
             '>scriptExecutor task finished.'
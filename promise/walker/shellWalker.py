@@ -12,19 +12,15 @@
 #
 
 from flask import g
-from flask_restful import reqparse, Resource
-from .models import Walker, ShellMission
+from flask_restful import reqparse, Resource, inputs
+from .models import Walker, TrailWriter, ShellMission
 from . import utils as walkerUtils
 from .. import app
 from ..ansiAdapter.ansiAdapter import ShellExecAdapter
 from .. import utils
 from ..user import auth
-import threading
-import thread
 from .. import dont_cache
-from .. import db
-
-threadLock = threading.Lock()
+from .executor import scheduler
 
 
 class ShellWalkerAPI(Resource):
@@ -39,17 +35,9 @@ class ShellWalkerAPI(Resource):
     @auth.PrivilegeAuth(privilegeRequired="shellExec")
     def post(self):
         # check the arguments
-        [iplist, shell, os_user, walker_name] = self.argCheckForPost()
-
-        # setup a walker
-        walker = Walker(walker_name)
+        [iplist, shell, os_user, walker_name, priority, run_options] = \
+            self.argCheckForPost()
 
-        [msg, trails] = walker.establish(iplist, g.current_user)
-        # setup a shellmission and link to the walker
-        shell_mission = ShellMission(shell, os_user, walker)
-        shell_mission.save()
-        walker.state = -1
-        walker.save()
         if os_user == 'root':
             private_key_file = app.config['ROOT_SSH_KEY_FILE']
         elif os_user == 'admin':
@@ -58,6 +46,15 @@ class ShellWalkerAPI(Resource):
             msg = 'wrong os user.'
             raise utils.InvalidAPIUsage(msg)
 
+        # setup a walker and a shellmission linked to it,
+        # they are saved with the trails at once
+        walker = Walker(walker_name)
+        shell_mission = ShellMission(shell, os_user, walker)
+        [msg, trails] = walker.establish(
+            iplist, g.current_user, shell_mission)
+        if trails is None:
+            raise utils.InvalidAPIUsage(msg, 500)
+
         # setup a shell mission walker executor
         # try:
 #        shell_walker_executor = ShellWalkerExecutor(
@@ -76,10 +73,13 @@ class ShellWalkerAPI(Resource):
 #            shell_mission,
 #            private_key_file=private_key_file)
 #        shell_walker_executor.run()
-        shell_walker_executor = ShellWalkerExecutorThr(
-            shell_mission,
-            private_key_file=private_key_file)
-        shell_walker_executor.start()
+        # run the executor in background, the walker waits in the queue
+        # until the scheduler is available
+        scheduler.submit(
+            walker.walker_id, g.current_user.user_id,
+            ShellWalkerExecutor.runMission,
+            (shell_mission.shellmission_id, private_key_file, run_options),
+            priority)
         msg = 'target shell execution established!'
         return {'message': msg, 'walker_id': walker.walker_id}, 200
 
@@ -89,13 +89,13 @@ class ShellWalkerAPI(Resource):
     @auth.PrivilegeAuth(privilegeRequired="shellExec")
     @dont_cache()
     def get(self):
-        walker_id = self.argCheckForGet()
+        [walker_id, summary] = self.argCheckForGet()
         if not walker_id:
             [msg, json_walkers] = self.getWalkerListOfTokenOwner()
             return {'message': msg, 'walkers': json_walkers}, 200
         else:
             [msg, walker_name, state, json_trails] = \
-                self.getWalkerInfoOfTokenOwner(walker_id)
+                self.getWalkerInfoOfTokenOwner(walker_id, summary)
             return {
                 'message': msg,
                 'walker_name': walker_name,
@@ -118,6 +118,18 @@ class ShellWalkerAPI(Resource):
         self.reqparse.add_argument(
             'name', type=str, location='json',
             help='default walker-name: time-shell')
+        self.reqparse.add_argument(
+            'priority', type=int, location='json', default=0,
+            help='priority must be an integer')
+        self.reqparse.add_argument(
+            'forks', type=inputs.positive, location='json',
+            help='forks must be a positive integer')
+        self.reqparse.add_argument(
+            'serial', type=inputs.positive, location='json',
+            help='serial must be a positive integer')
+        self.reqparse.add_argument(
+            'timeout', type=inputs.positive, location='json',
+            help='timeout must be a positive integer')
 
         args = self.reqparse.parse_args()
         iplist = args['iplist']
@@ -130,18 +142,24 @@ class ShellWalkerAPI(Resource):
         walker_name = args['name']
         if not walker_name:
             walker_name = str(walkerUtils.serialCurrentTime()) + '-' + shell
+        priority = args['priority']
+        run_options = walkerUtils.ansibleRunOptions(
+            args['forks'], args['serial'], args['timeout'])
 
-        return [iplist, shell, os_user, walker_name]
+        return [iplist, shell, os_user, walker_name, priority, run_options]
 
     def argCheckForGet(self):
         self.reqparse.add_argument(
             'walkerid', type=str,
             location='args', help='walker id must be a string')
+        self.reqparse.add_argument(
+            'summary', type=inputs.boolean, location='args', default=False,
+            help='summary must be boolean')
         args = self.reqparse.parse_args()
         walker_id = args['walkerid']
         if not walker_id:
             walker_id = None
-        return walker_id
+        return [walker_id, args['summary']]
 
     @staticmethod
     def getWalkerListOfTokenOwner():
@@ -150,11 +168,11 @@ class ShellWalkerAPI(Resource):
         return [msg, json_walkers]
 
     @staticmethod
-    def getWalkerInfoOfTokenOwner(walker_id):
+    def getWalkerInfoOfTokenOwner(walker_id, summary=False):
         [walker, json_walker] = Walker.getFromWalkerIdWithinUser(
             walker_id, g.current_user)
         if walker:
-            [trails, json_trails] = walker.getTrails()
+            [trails, json_trails] = walker.getTrails(summary)
             msg = 'walker info'
             return [msg, walker.walker_name, walker.state, json_trails]
         else:
@@ -170,12 +188,14 @@ class ShellWalkerAPI(Resource):
 # class ShellWalkerExecutor(threading.Thread):
 class ShellWalkerExecutor(Resource):
     def __init__(self, shell_mission, private_key_file='~/.ssh/id_rsa',
-                 become_pass=None):
+                 become_pass=None, run_options=None):
         # threading.Thread.__init__(self)
         self.shell_mission = shell_mission
         self.walker = shell_mission.getWalker()
-        [trails, json_trails] = shell_mission.getTrails()
-        self.trails = trails
+        # results of hosts are written in bulk as hosts finish
+        self.writer = TrailWriter(self.walker)
+        # num of failures and unreachable counted as hosts finish
+        self.failures = 0
         self.owner = self.walker.getOwner()
         self.hostnames = shell_mission.getIplist()
         self.remote_user = shell_mission.osuser
@@ -189,22 +209,34 @@ class ShellWalkerExecutor(Resource):
             private_key_file,
             run_data,
             become_pass,
-            shell_mission.shell)
+            shell_mission.shell,
+            on_result=self.onResult,
+            **(run_options or {}))
+
+    @staticmethod
+    def runMission(shellmission_id, private_key_file, run_options):
+        shell_mission = ShellMission.query.filter_by(
+            shellmission_id=shellmission_id).first()
+        shell_walker_executor = ShellWalkerExecutor(
+            shell_mission, private_key_file=private_key_file,
+            run_options=run_options)
+        shell_walker_executor.run()
+
+    def onResult(self, host, stat_sum, result):
+        # buffer the trail(s) of the host once its result arrives
+        self.writer.add(host, stat_sum, result)
+        self.failures += stat_sum['failures'] + stat_sum['unreachable']
 
     def run(self):
         msg = 'walker<id:' + self.walker.walker_id + '> begin to run.'
         app.logger.info(utils.logmsg(msg))
+        self.walker.state = -1
+        self.walker.save()
 
+        # trails are written by onResult in chunks while hosts finish,
+        # the rest of them together with the state of the walker
         [state, stats_sum, results] = self.shell_exec_adpater.run()
-        # threadLock.acquire()
-        for trail in self.trails:
-            host_result = results[trail.ip]
-            host_stat_sum = stats_sum[trail.ip]
-            trail.resultUpdate(host_stat_sum, host_result)
-            [save_state, msg] = trail.save()
-        self.walker.state = state
-        self.walker.save()
-        # threadLock.release()
+        self.writer.close(self.failures if self.failures else state)
 
         msg = 'walker<id:' + self.walker.walker_id + \
             '>shellExecutor task finished.'
@@ -214,48 +246,3 @@ class ShellWalkerExecutor(Resource):
 #        except:
 #            msg = 'walker<' + self.walker.walker_id + '> thread cannot exit.'
 #            app.logger.info(utils.logmsg(msg))
-
-
-class ShellWalkerExecutorThr(threading.Thread):
-    def __init__(self, shell_mission, private_key_file='~/.ssh/id_rsa',
-                 become_pass=None):
-        threading.Thread.__init__(self)
-        self.shell_mission = shell_mission
-        self.walker = shell_mission.getWalker()
-        [trails, json_trails] = shell_mission.getTrails()
-        self.trails = trails
-        self.owner = self.walker.getOwner()
-        self.hostnames = shell_mission.getIplist()
-        self.remote_user = shell_mission.osuser
-        run_data = {
-            'walker_id': self.walker.walker_id,
-            'user_id': self.owner.user_id
-        }
-        self.shell_exec_adpater = ShellExecAdapter(
-            self.hostnames,
-            self.remote_user,
-            private_key_file,
-            run_data,
-            become_pass,
-            shell_mission.shell)
-
-    def run(self):
-        msg = 'walker<id:' + self.walker.walker_id + '> begin to run.'
-        app.logger.info(utils.logmsg(msg))
-
-        [state, stats_sum, results] = self.shell_exec_adpater.run()
-        threadLock.acquire()
-        for trail in self.trails:
-            host_result = results[trail.ip]
-            host_stat_sum = stats_sum[trail.ip]
-            trail.resultUpdate(host_stat_sum, host_result)
-            [save_state, msg] = trail.save()
-        self.walker.state = state
-        self.walker.save()
-        threadLock.release()
-
-        msg = 'walker<id:' + self.walker.walker_id + \
-            '>shellExecutor task finished.'
-        app.logger.info(utils.logmsg(msg))
-        db.session.close()
-        thread.exit()
@@ -26,6 +26,21 @@ def hash_pass(password):
     return md5.new(salted_password).hexdigest()
 
 
+def ansibleRunOptions(forks=None, serial=None, timeout=None):
+    """
+        Ansible run options of a walker, server defaults are used
+        for those not given and forks are limited by the server.
+    """
+    forks = min(
+        forks or app.config['ANSIBLE_FORKS'], app.config['ANSIBLE_MAX_FORKS'])
+    serial = serial or app.config['ANSIBLE_SERIAL'] or None
+    timeout = timeout or app.config['ANSIBLE_SSH_TIMEOUT']
+    return dict(forks=forks, serial=serial, timeout=timeout,
+                control_dir=app.config['ANSIBLE_SSH_CONTROL_DIR'],
+                persist=app.config['ANSIBLE_SSH_PERSIST'],
+                pipelining=app.config['ANSIBLE_SSH_PIPELINING'])
+
+
 def serialCurrentTime():
     return datetime.datetime.now().strftime('%Y%m%d%H%M%S')
 
@@ -11,12 +11,14 @@
 # a playbook walker will establish  one ansible play with a playbook
 #
 
-from flask import g
-from flask_restful import reqparse, Resource
-from .models import Walker, Script
+from flask import g, request, Response
+from flask_restful import reqparse, Resource, inputs
+from .models import Walker, Script, Trail, ForwardMission
 from . import utils as walkerUtils
 from .. import utils
 from ..user import auth
+from .. import dont_cache
+from .executor import scheduler
 import thread
 
 
@@ -37,13 +39,13 @@ class WalkerAPI(Resource):
     """
     @auth.PrivilegeAuth(privilegeRequired="scriptExec")
     def get(self):
-        walker_id = self.argCheckForGet()
+        [walker_id, summary] = self.argCheckForGet()
         if not walker_id:
             [msg, json_walkers] = self.getWalkerListOfTokenOwner()
             return {'message': msg, 'walkers': json_walkers}, 200
         else:
             [msg, walker_name, state, json_trails] = \
-                self.getWalkerInfoOfTokenOwner(walker_id)
+                self.getWalkerInfoOfTokenOwner(walker_id, summary)
             return {
                 'message': msg,
                 'walker_name': walker_name,
@@ -98,11 +100,14 @@ class WalkerAPI(Resource):
         self.reqparse.add_argument(
             'walkerid', type=str,
             location='args', help='walker id must be a string')
+        self.reqparse.add_argument(
+            'summary', type=inputs.boolean, location='args', default=False,
+            help='summary must be boolean')
         args = self.reqparse.parse_args()
         walker_id = args['walkerid']
         if not walker_id:
             walker_id = None
-        return walker_id
+        return [walker_id, args['summary']]
 
     @staticmethod
     def getWalkerListOfTokenOwner():
@@ -121,11 +126,11 @@ class WalkerAPI(Resource):
         return [msg, walker.walker_name, json_trails]
 
     @staticmethod
-    def getWalkerInfoOfTokenOwner(walker_id):
+    def getWalkerInfoOfTokenOwner(walker_id, summary=False):
         [walker, json_walker] = Walker.getFromWalkerIdWithinUser(
             walker_id, g.current_user)
         if walker:
-            [trails, json_trails] = walker.getTrails()
+            [trails, json_trails] = walker.getTrails(summary)
             msg = 'walker info'
             return [msg, walker.walker_name, walker.state, json_trails]
         else:
@@ -136,3 +141,128 @@ class WalkerAPI(Resource):
     def run(shell_walker_executor):
         shell_walker_executor.run()
         thread.exit()
+
+
+class WalkerSchedulerAPI(Resource):
+    """
+    queue depth and running count of the walker scheduler.
+    """
+    @auth.PrivilegeAuth(privilegeRequired="scriptExec")
+    @dont_cache()
+    def get(self):
+        response = {'message': 'walker scheduler stats'}
+        response.update(scheduler.stats())
+        return response, 200
+
+
+class TrailOutputAPI(Resource):
+    """
+    read the stdout or stderr of a trail, or the stdout of a forward
+    mission, without loading the whole of it: a byte range of it (by the
+    Range header, or by offset and limit), or all of it streamed as
+    server-sent events.
+    """
+    def __init__(self):
+        self.reqparse = reqparse.RequestParser()
+        super(TrailOutputAPI, self).__init__()
+
+    # any user may read the outputs of the walkers he owns
+    @auth.PrivilegeAuth(privilegeRequired=None)
+    @dont_cache()
+    def get(self):
+        [trail_id, forwardmission_id, key, offset, limit, stream] = \
+            self.argCheckForGet()
+        if trail_id:
+            owner = Trail.getFromTrailIdWithinUser(trail_id, g.current_user)
+            if not owner:
+                msg = 'wrong trail id'
+                raise utils.InvalidAPIUsage(msg)
+        else:
+            owner = ForwardMission.getFromIdWithinUser(
+                forwardmission_id, g.current_user)
+            if not owner:
+                msg = 'wrong forward mission id'
+                raise utils.InvalidAPIUsage(msg)
+        length = getattr(owner, key + '_length')
+        if length is None:
+            # written before the output store, the whole output is kept
+            length = len((getattr(owner, key) or u'').encode('utf-8'))
+        if stream:
+            # a reconnecting client resumes from the last event it got
+            last = request.headers.get('Last-Event-ID', '')
+            if last.isdigit():
+                offset = int(last)
+            return Response(
+                self.events(owner.readOutput(key, offset), offset),
+                mimetype='text/event-stream')
+        if request.range:
+            span = request.range.range_for_length(length)
+            if span is None:
+                msg = 'range not satisfiable'
+                raise utils.InvalidAPIUsage(msg, 416)
+            offset, limit = span[0], span[1] - span[0]
+        start = min(offset, length)
+        stop = length if limit is None else min(start + limit, length)
+        response = Response(
+            owner.readOutput(key, start, stop - start),
+            mimetype='text/plain')
+        response.headers['Accept-Ranges'] = 'bytes'
+        response.headers['Content-Length'] = str(stop - start)
+        if stop > start and stop - start < length:
+            response.status_code = 206
+            response.headers['Content-Range'] = 'bytes %d-%d/%d' % (
+                start, stop - 1, length)
+        return response
+
+    @staticmethod
+    def events(pieces, offset):
+        """
+        an event of the whole lines got for each piece of the output,
+        its id is the byte offset following them, from which a client
+        can resume, an 'end' event comes at last.
+        """
+        rest = ''
+        for piece in pieces:
+            lines = (rest + piece).split('\n')
+            rest = lines.pop()
+            if lines:
+                offset += sum(len(x) + 1 for x in lines)
+                yield 'id: %d\n%s\n' % (offset, ''.join(
+                    'data: %s\n' % x.rstrip('\r') for x in lines))
+        if rest:
+            offset += len(rest)
+            yield 'id: %d\ndata: %s\n\n' % (offset, rest.rstrip('\r'))
+        yield 'event: end\ndata: %d\n\n' % offset
+
+    """
+    arguments check methods
+    """
+    def argCheckForGet(self):
+        self.reqparse.add_argument(
+            'trailid', type=str, location='args',
+            help='trail id must be a string')
+        self.reqparse.add_argument(
+            'forwardmissionid', type=str, location='args',
+            help='forward mission id must be a string')
+        self.reqparse.add_argument(
+            'output', type=str, location='args', default='stdout',
+            choices=('stdout', 'stderr'),
+            help='output must be stdout or stderr')
+        self.reqparse.add_argument(
+            'offset', type=inputs.natural, location='args', default=0,
+            help='offset must be a natural number')
+        self.reqparse.add_argument(
+            'limit', type=inputs.positive, location='args',
+            help='limit must be a positive integer')
+        self.reqparse.add_argument(
+            'stream', type=inputs.boolean, location='args', default=False,
+            help='stream must be boolean')
+        args = self.reqparse.parse_args()
+        if bool(args['trailid']) == bool(args['forwardmissionid']):
+            msg = 'either trail id or forward mission id is required'
+            raise utils.InvalidAPIUsage(msg)
+        if args['forwardmissionid'] and args['output'] != 'stdout':
+            msg = 'forward missions have stdout only'
+            raise utils.InvalidAPIUsage(msg)
+        return [args['trailid'], args['forwardmissionid'], args['output'],
+                args['offset'], args['limit'], args['stream']]
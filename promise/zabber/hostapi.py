@@ -9,9 +9,10 @@
 # with method GET（POST, PUT, DELETE unavailable now）.
 #
 from flask.ext.restful import reqparse, Resource, inputs
-from .models import Host
+from .models import Host, fields, cache
 from ..user import auth
 from .. import app, utils
+import json
 
 
 class HostListAPI(Resource):
@@ -19,6 +20,9 @@ class HostListAPI(Resource):
         HostList Restful API.
         for GET (Readonly)
     """
+    # 'select*' params of zabbix allowed
+    selects = ('selectInterfaces', 'selectGroups', 'selectInventory')
+
     def __init__(self):
         super(HostListAPI, self).__init__()
         self.parser = reqparse.RequestParser()
@@ -30,23 +34,43 @@ class HostListAPI(Resource):
         self.parser.add_argument(
             'pp', type=inputs.positive,
             help='PerPage must be a positive integer', dest='perpage')
+        # after: get the items following the hostid cursor instead of a page
+        self.parser.add_argument(
+            'after', type=inputs.natural,
+            help='after must be a hostid')
+        # fields of items, 'extend', 'count' or comma separated fields
+        for name in ('output', ) + self.selects:
+            self.parser.add_argument(
+                name, type=fields, help='%s must be fields' % name)
 
     # get whole list of hosts existing
     @auth.PrivilegeAuth(privilegeRequired="inventoryAdmin")
     def get(self):
         args = self.parser.parse_args()
+        # served from the cache, zabbix is asked once for all those
+        # requesting the same while it is missed
+        key = json.dumps(['host', args], sort_keys=True)
+        return cache.load(
+            key, lambda: self.getList(args),
+            stale=app.config['ZABBER_CACHE_STALE'])
+
+    def getList(self, args):
+        select = dict((x, args[x]) for x in ('output', ) + self.selects
+                      if args[x] is not None)
         page = args['page']
-        if not page:
-            data = Host().get()
+        after = args['after']
+        if not page and after is None:
+            data = Host().get(select=select)
             return {'data': data}, 200
-        else:
-            perPage = args['perpage']
-            h = Host()
-            if not perPage:
-                data = h.get(page=page)
-            else:
-                data = h.get(page=page, pp=perPage)
-            return {'totalpage': h.pages, 'data': data}, 200
+        h = Host()
+        perPage = args['perpage'] or 10
+        if after is not None:
+            data = h.get(pp=perPage, select=select, after=after)
+            # cursor of the next items
+            after = data[-1]['hostid'] if data else None
+            return {'after': after, 'data': data}, 200
+        data = h.get(page=page, pp=perPage, select=select)
+        return {'totalpage': h.pages, 'data': data}, 200
 
 
 class HostAPI(Resource):
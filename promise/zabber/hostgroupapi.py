@@ -9,9 +9,10 @@
 # with method GET, POST, PUT, DELETE.
 #
 from flask.ext.restful import reqparse, Resource, inputs
-from .models import HostGroup, Host
+from .models import HostGroup, Host, fields, cache
 from ..user import auth
 from .. import app, utils
+import json
 
 
 class HostGroupListAPI(Resource):
@@ -19,6 +20,9 @@ class HostGroupListAPI(Resource):
         HostGroupList Restful API.
         for GET (Readonly)
     """
+    # 'select*' params of zabbix allowed
+    selects = ('selectHosts',)
+
     def __init__(self):
         super(HostGroupListAPI, self).__init__()
         self.parser = reqparse.RequestParser()
@@ -30,23 +34,43 @@ class HostGroupListAPI(Resource):
         self.parser.add_argument(
             'pp', type=inputs.positive,
             help='perpage must be a positive integer', dest='perpage')
+        # after: get the items following the groupid cursor instead of a page
+        self.parser.add_argument(
+            'after', type=inputs.natural,
+            help='after must be a groupid')
+        # fields of items, 'extend', 'count' or comma separated fields
+        for name in ('output', ) + self.selects:
+            self.parser.add_argument(
+                name, type=fields, help='%s must be fields' % name)
 
     # get host group list
     @auth.PrivilegeAuth(privilegeRequired="inventoryAdmin")
     def get(self):
         args = self.parser.parse_args()
+        # served from the cache, zabbix is asked once for all those
+        # requesting the same while it is missed
+        key = json.dumps(['hostgroup', args], sort_keys=True)
+        return cache.load(
+            key, lambda: self.getList(args),
+            stale=app.config['ZABBER_CACHE_STALE'])
+
+    def getList(self, args):
+        select = dict((x, args[x]) for x in ('output', ) + self.selects
+                      if args[x] is not None)
         page = args['page']
-        if not page:
-            data = HostGroup().get()
+        after = args['after']
+        if not page and after is None:
+            data = HostGroup().get(select=select)
             return {'data': data}, 200
-        else:
-            perPage = args['perpage']
-            hg = HostGroup()
-            if not perPage:
-                data = hg.get(page=page)
-            else:
-                data = hg.get(page=page, pp=perPage)
-            return {'totalpage': hg.pages, 'data': data}, 200
+        hg = HostGroup()
+        perPage = args['perpage'] or 10
+        if after is not None:
+            data = hg.get(pp=perPage, select=select, after=after)
+            # cursor of the next items
+            after = data[-1]['groupid'] if data else None
+            return {'after': after, 'data': data}, 200
+        data = hg.get(page=page, pp=perPage, select=select)
+        return {'totalpage': hg.pages, 'data': data}, 200
 
 
 class HostGroupAPI(Resource):
@@ -71,17 +95,21 @@ class HostGroupAPI(Resource):
 
     # get info of a hostgroup by groupid
     def get(self, groupid):
-        # 1. constraint check
+        # check, get hostgroup basic info and its host(s) in one request
         hg = HostGroup()
-        if not hg.exists(groupid=groupid):
+        [exists, groups, hosts] = hg.batch([
+            ('%s.exists' % hg.default_object_name, {'groupid': groupid}),
+            ('%s.get' % hg.default_object_name, hg.getParams(groupid=groupid)),
+            ('%s.get' % Host.default_object_name,
+             Host().getParams(groupid=groupid))])
+        # 1. constraint check
+        if not exists:
             msg = self.__GroupNotFound % {'groupid': groupid}
             app.logger.info(utils.logmsg(msg))
             return {'error': msg}, 404
         # 2. get execution
-        # 2.1 get hostgroup basic info
-        data = hg.get(groupid=groupid)[0]
-        # 2.2 get host(s) of the hostgroup
-        data['hosts'] = Host().get(groupid=groupid)
+        data = groups[0]
+        data['hosts'] = hosts
         return {'data': data}, 200
 
     # create a new hostgroup
@@ -101,6 +129,7 @@ class HostGroupAPI(Resource):
             return {'error': msg}, 403
         # 3. create execution
         data = {'groupid': hg.create(name)['groupids'][0]}
+        cache.clear()
         return {'data': data}, 201
 
     # update an existing hostgroup
@@ -124,6 +153,7 @@ class HostGroupAPI(Resource):
             return {'error': msg}, 403
         # 3. update execution
         data = {'groupid': hg.update(groupid, name)['groupids'][0]}
+        cache.clear()
         return {'data': data}, 201
 
     # delete an existing hostgroup
@@ -136,4 +166,5 @@ class HostGroupAPI(Resource):
             return {'error': msg}, 404
         # 2. delete execution
         data = {'groupid': hg.delete(groupid)['groupids'][0]}
+        cache.clear()
         return {'data': data}, 204
@@ -8,6 +8,59 @@
 # This is the model module based on zabbix for the cmdb package.
 #
 from .zapi import ZabbixAPI
+from .. import app, utils
+
+# results of zabber list apis, cleared once a hostgroup is changed
+cache = utils.TTLCache(
+    app.config['ZABBER_CACHE_SIZE'], app.config['ZABBER_CACHE_TTL'])
+
+
+# parse fields of zabbix api 'output' or 'select*' params
+# given as 'extend', 'count' or a comma separated list
+def fields(value):
+    if value in ('extend', 'count'):
+        return value
+    return [x.strip() for x in value.split(',') if x.strip()]
+
+
+# get one page of objects, paging done by zabbix:
+# ids of objects are listed sorted and limited first,
+# and only objects of the page are got with the params.
+# page < 0 means the first page, page >= pages means the last page.
+# with the id cursor 'after', objects following it are got instead.
+# return objects and number of pages
+def paginate(zapi, method, id_field, params, page=0, pp=10, after=None):
+    ids_param = id_field + 's'
+    # filters of params, without output and select*
+    base = dict((k, v) for k, v in params.items()
+                if k != 'output' and not k.startswith('select'))
+    ids_params = dict(
+        base, output=[id_field], sortfield=id_field, sortorder='ASC')
+    pages = 0
+    if after is not None:
+        ids = [x[id_field] for x in zapi.batch([(method, ids_params)])[0]]
+        ids = [x for x in ids if int(x) > int(after)][:pp]
+    else:
+        ids_params['limit'] = max(page, 1) * pp
+        [count, ids] = zapi.batch([
+            (method, dict(base, countOutput=True)), (method, ids_params)])
+        ids = [x[id_field] for x in ids]
+        pages = (int(count) + pp - 1) / pp
+        if page < 0:
+            ids = ids[:pp]
+        elif page < pages:
+            ids = ids[(page - 1) * pp:page * pp]
+        else:
+            ids = ids[(pages - 1) * pp:] if pages else []
+    if not ids:
+        return [[], pages]
+    params = dict(params, sortfield=id_field, sortorder='ASC')
+    params[ids_param] = ids
+    # the id is needed by the cursor
+    if isinstance(params.get('output'), list) and \
+            id_field not in params['output']:
+        params['output'] = params['output'] + [id_field]
+    return [zapi.batch([(method, params)])[0], pages]
 
 
 class HostGroup(object):
@@ -21,7 +74,7 @@ class HostGroup(object):
     def __init__(self):
         # call for standard zabbix api
         self.__zapi = ZabbixAPI()
-        # login to zabbix server
+        # login to zabbix server, unless logged in already
         self.__zapi.login()
         # create a standard zabbix api object 'Hostgroup'
         self.__zapiobj = self.__zapi.__getattr__(self.default_object_name)
@@ -54,32 +107,40 @@ class HostGroup(object):
             '%s.exists' % self.default_object_name, params)
         return result
 
-    # get hostgroup(s) by groupid or related hostid
+    # params to get hostgroup(s) by groupid or related hostid
     # such as 'templateids', 'triggerids', ... are supported
     # here using 'groupids' and 'hostids' only
-    def get(self, groupid='', hostid='', page=0, pp=10):
+    # 'output' and 'select*' params can be chosen by select
+    def getParams(self, groupid='', hostid='', select=None):
         params = {}
         if hostid:
             params['hostids'] = hostid
         if groupid:
             params['groupids'] = groupid
         params['output'] = 'extend'
-        result = self.__zapiobj.proxy_method(
-            '%s.get' % self.default_object_name, params)
+        params.update(select or {})
+        return params
+
+    # get hostgroup(s) by groupid or related hostid,
+    # a page of them or those after the groupid cursor if asked
+    def get(self, groupid='', hostid='', page=0, pp=10, select=None,
+            after=None):
+        params = self.getParams(
+            groupid=groupid, hostid=hostid, select=select)
+        if not page and after is None:
+            return self.__zapiobj.proxy_method(
+                '%s.get' % self.default_object_name, params)
         # for paging
-        if page:
-            count = len(result)
-            self.pages = (count + pp - 1) / pp
-            if page < 0:
-                result = [result[i] for i in range(0, pp)]
-            elif page < self.pages:
-                result = [
-                    result[i] for i in range((page - 1) * pp, page * pp)]
-            elif page >= self.pages:
-                result = [
-                    result[i] for i in range((self.pages - 1) * pp, count)]
+        [result, self.pages] = paginate(
+            self.__zapi, '%s.get' % self.default_object_name, 'groupid',
+            params, page=page, pp=pp, after=after)
         return result
 
+    # request several zabbix api methods in one round trip,
+    # calls is a list of (method, params), results are returned in order
+    def batch(self, calls):
+        return self.__zapi.batch(calls)
+
     # get a hostgroup object by groupid
     # only 'groupid' and 'name' are supported as search params
     # here using 'groupid' only
@@ -127,6 +188,7 @@ class Host(object):
 
     def __init__(self):
         self.__zapi = ZabbixAPI()
+        # login to zabbix server, unless logged in already
         self.__zapi.login()
         # create a standard zabbix api object 'Host'
         self.__zapiobj = self.__zapi.__getattr__(self.default_object_name)
@@ -146,10 +208,11 @@ class Host(object):
             '%s.exists' % self.default_object_name, params)
         return result
 
-    # get host(s) with given hostid or groupid(hostgroup)
+    # params to get host(s) with given hostid or groupid(hostgroup)
     # such as 'itemids', 'applicationids', ... are supported
     # here using 'hostids' and 'groupids' only
-    def get(self, hostid='', groupid='', page=0, pp=10):
+    # 'output' and 'select*' params can be chosen by select
+    def getParams(self, hostid='', groupid='', select=None):
         params = {}
         if hostid:
             params['hostids'] = hostid
@@ -161,20 +224,22 @@ class Host(object):
             "interfaceid", "hostid", "ip", "dns", "port"]
         params['selectGroups'] = ['groupid', "name"]
         params['selectInventory'] = 'extend'
-        result = self.__zapiobj.proxy_method(
-            '%s.get' % self.default_object_name, params)
+        params.update(select or {})
+        return params
+
+    # get host(s) with given hostid or groupid(hostgroup),
+    # a page of them or those after the hostid cursor if asked
+    def get(self, hostid='', groupid='', page=0, pp=10, select=None,
+            after=None):
+        params = self.getParams(
+            hostid=hostid, groupid=groupid, select=select)
+        if not page and after is None:
+            return self.__zapiobj.proxy_method(
+                '%s.get' % self.default_object_name, params)
         # for paging
-        if page:
-            count = len(result)
-            self.pages = (count + pp - 1) / pp
-            if page < 0:
-                result = [result[i] for i in range(0, pp)]
-            elif page < self.pages:
-                result = [
-                    result[i] for i in range((page - 1) * pp, page * pp)]
-            elif page >= self.pages:
-                result = [
-                    result[i] for i in range((self.pages - 1) * pp, count)]
+        [result, self.pages] = paginate(
+            self.__zapi, '%s.get' % self.default_object_name, 'hostid',
+            params, page=page, pp=pp, after=after)
         return result
 
     # get a host object by hostid
@@ -212,6 +277,7 @@ class HostInterface(object):
 
     def __init__(self):
         self.__zapi = ZabbixAPI()
+        # login to zabbix server, unless logged in already
         self.__zapi.login()
         # create a standard zabbix api object 'Hostinterface'
         self.__zapiobj = self.__zapi.__getattr__(self.default_object_name)
@@ -12,7 +12,9 @@ try:
 except ImportError:
     import json
 
-import urllib2
+import threading
+import requests
+from requests.adapters import HTTPAdapter
 from .. import app
 
 
@@ -20,6 +22,16 @@ class ZabbixAPIException(Exception):
     pass
 
 
+# check if a zabbix api response tells the auth token expired,
+# the response of a batch is a list
+def auth_expired(content):
+    if isinstance(content, list):
+        return any(auth_expired(x) for x in content)
+    error = content.get('error') or {}
+    msg = '%s %s' % (error.get('message', ''), error.get('data', ''))
+    return 're-login' in msg or 'Not authori' in msg
+
+
 class ZabbixAPI(object):
     """
         Zabbix API for Python
@@ -27,6 +39,11 @@ class ZabbixAPI(object):
     __auth = ''
     __id = 0
     _state = {}
+    # http session keeping connections to zabbix alive, shared by threads
+    __session = None
+    __lock = threading.Lock()
+    # only one thread logs in at a time
+    __login_lock = threading.Lock()
 
     # create a new ZabbixAPI Object if not exists
     def __new__(cls, *args, **kw):
@@ -58,20 +75,21 @@ class ZabbixAPI(object):
         return self.__dict__[name]
 
     # user login for zabbix api which returns an authorization token
-    # as self.__auth
-    def login(self):
-        user_info = {'user': self.__user,
-                     'password': self.__password}
-        obj = self.json_obj('user.login', user_info)
-        try:
+    # as self.__auth, the token is kept for all the later requests,
+    # login again only if the token is the expired one
+    def login(self, expired=None):
+        with self.__login_lock:
+            if self.is_login() and self.__auth != expired:
+                return
+            user_info = {'user': self.__user,
+                         'password': self.__password}
+            obj = self.json_obj('user.login', user_info)
             content = self.post_request(obj)
-        except urllib2.HTTPError:
-            raise ZabbixAPIException("Zabbix URL Error")
-        try:
-            self.__auth = content['result']
-        except KeyError, e:
-            e = content['error']['data']
-            raise ZabbixAPIException(e)
+            try:
+                self.__auth = content['result']
+            except KeyError, e:
+                e = content['error']['data']
+                raise ZabbixAPIException(e)
 
     # check user login status for zabbix
     def is_login(self):
@@ -93,16 +111,70 @@ class ZabbixAPI(object):
             obj['auth'] = self.__auth
         return json.dumps(obj)
 
+    # http session with a pool of keep-alive connections to zabbix
+    def session(self):
+        with self.__lock:
+            if ZabbixAPI.__session is None:
+                session = requests.Session()
+                size = app.config['ZABBIX_POOL_SIZE']
+                adapter = HTTPAdapter(
+                    pool_connections=1, pool_maxsize=size)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                session.headers.update({
+                    'Content-Type': 'application/json',
+                    'User-Agent': 'ZabbixAPI'})
+                ZabbixAPI.__session = session
+            return ZabbixAPI.__session
+
     # request a zabbix api
     def post_request(self, json_obj):
-        headers = {'Content-Type': 'application/json',
-                   'User-Agent': 'ZabbixAPI'}
-        req = urllib2.Request(self.__url, json_obj, headers)
-        opener = urllib2.urlopen(req)
-        content = json.loads(opener.read())
+        try:
+            response = self.session().post(
+                self.__url, data=json_obj,
+                timeout=(app.config['ZABBIX_CONNECT_TIMEOUT'],
+                         app.config['ZABBIX_READ_TIMEOUT']))
+            response.raise_for_status()
+        except requests.RequestException, e:
+            raise ZabbixAPIException("Zabbix URL Error: %s" % e)
+        content = json.loads(response.content)
         self.__id += 1
         return content
 
+    # request a zabbix api with the json built by build(),
+    # login again and retry once if the token expired
+    def post_auth_request(self, build):
+        auth = self.__auth
+        content = self.post_request(build())
+        if auth_expired(content):
+            self.login(expired=auth)
+            content = self.post_request(build())
+        return content
+
+    # request several zabbix api methods at once as a json-rpc batch,
+    # calls is a list of (method, params), results are returned in order
+    def batch(self, calls):
+        self.__checkAuth__()
+        content = self.post_auth_request(lambda: json.dumps([{
+            'jsonrpc': '2.0',
+            'method': method,
+            'params': params,
+            'auth': self.__auth,
+            'id': i} for i, (method, params) in enumerate(calls)]))
+        if isinstance(content, dict):
+            # a batch failed as a whole
+            content = [content]
+        responses = dict((x.get('id'), x) for x in content)
+        results = list()
+        for i in range(len(calls)):
+            response = responses.get(i, {})
+            try:
+                results.append(response['result'])
+            except KeyError:
+                e = response.get('error', {}).get('data', 'No response')
+                raise ZabbixAPIException(e)
+        return results
+
 
 """
    Decorate Method
@@ -121,7 +193,8 @@ def check_auth(func):
 def zabbix_api_object_method(func):
     def wrapper(self, method_name, params):
         try:
-            content = self.post_request(self.json_obj(method_name, params))
+            content = self.post_auth_request(
+                lambda: self.json_obj(method_name, params))
             return content['result']
         except KeyError, e:
             e = content['error']['data']
@@ -148,6 +221,10 @@ class ZabbixAPIObjectFactory(object):
     def post_request(self, json_obj):
         return self.__zapi.post_request(json_obj)
 
+    # request a zabbix api with token using the ZabbixAPI Object
+    def post_auth_request(self, build):
+        return self.__zapi.post_auth_request(build)
+
     # jsonify parameters for zabbix api request using the ZabbixAPI Object
     def json_obj(self, method, param):
         return self.__zapi.json_obj(method, param)
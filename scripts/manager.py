@@ -4,11 +4,13 @@ sys.path.append('.')
 
 from flask.ext.script import Manager, Shell, prompt_bool
 from flask.ext.migrate import Migrate, MigrateCommand
+from sqlalchemy import text
 
 from promise import app, db
 from promise.user import utils as userUtils
 from promise.user.models import User, Privilege, Role
 from promise.eater.models import ITModel, Connection, OSUser
+from promise.walker.executor import scheduler
 
 migrate = Migrate(app, db)
 
@@ -161,6 +163,12 @@ def recreatedb():
     importdata()
 
 
+@manager.command
+def recoverwalkers():
+    "mark walkers left queued or running by stopped backends as faild"
+    scheduler.recover()
+
+
 @manager.command
 def systemupdate():
     "for system update."
@@ -187,6 +195,29 @@ def systemupdate():
     user4.save()
 
 
+@manager.command
+def updateoutputs():
+    "add the output store to an existing database, safe to run again"
+    # outputs of walkers are kept by their summaries, the whole of them
+    # go to the output table made by create_all
+    db.create_all()
+    for table, key in (('trail', 'stdout'), ('trail', 'stderr'),
+                       ('forwardmission', 'stdout')):
+        for column, type_ in (('%s_length' % key, 'int'),
+                              ('%s_digest' % key, 'varchar(40)')):
+            found = db.engine.execute(
+                text("SELECT COUNT(*) FROM information_schema.columns "
+                     "WHERE table_schema=DATABASE() AND table_name=:table "
+                     "AND column_name=:column;"),
+                table=table, column=column).scalar()
+            if found:
+                print '[%-10s] %s exists' % (table.upper(), column)
+                continue
+            db.engine.execute(
+                "ALTER TABLE %s ADD %s %s;" % (table, column, type_))
+            print '[%-10s] %s added' % (table.upper(), column)
+
+
 @manager.command
 def eater_importdata():
     "import data to eater"
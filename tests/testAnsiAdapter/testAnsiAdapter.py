@@ -0,0 +1,131 @@
+# -*- coding:utf-8 -*-
+# !/usr/bin/env python
+#
+# Author: Shawn.T
+# Email: shawntai.ds@gmail.com
+#
+# This is autotest for the ansible driver module.
+
+import sys
+sys.path.append('.')
+
+from nose.tools import *
+import os
+import shutil
+import tempfile
+import threading
+import time
+from mock import Mock, patch
+
+from ansible.playbook.play_context import PlayContext
+
+from promise.ansiAdapter.ansiAdapter import ShellExecAdapter, runInBatches, \
+    AnsibleRuntime, scriptFile
+
+
+class TestAnsiAdapter():
+    '''
+        Unit test for the adapters running ansible plays
+    '''
+    def adapter(self, walker_id, hostnames):
+        hosts = [
+            '%s ansible_connection=local ansible_python_interpreter=%s' % (
+                x, sys.executable) for x in hostnames]
+        adapter = ShellExecAdapter(
+            hosts, 'root', None, {'walker_id': walker_id, 'user_id': 'tom'},
+            None, 'echo {{ inventory_hostname }}', forks=2)
+        adapter.options.become = False
+        return adapter
+
+    def test_concurrent_plays(self):
+        '''
+            plays running at the same time only run on their own hosts
+        '''
+        hostnames = {
+            'w1': ['w1-h%d' % i for i in range(3)],
+            'w2': ['w2-h%d' % i for i in range(4)]}
+        adapters = dict((k, self.adapter(k, w)) for k, w in hostnames.items())
+        # hosts of a play are not taken from the one built after it
+        for k, w in adapters.items():
+            eq_(sorted(x.name for x in w.inventory.get_hosts(w.play.hosts)),
+                hostnames[k])
+        results = {}
+
+        def run(k):
+            results[k] = adapters[k].run()
+        threads = [threading.Thread(target=run, args=(k, ))
+                   for k in adapters]
+        for x in threads:
+            x.start()
+        for x in threads:
+            x.join(60)
+        eq_(sorted(results), ['w1', 'w2'])
+        for k, w in results.items():
+            [state, stats_sum, outputs] = w
+            eq_(state, 0)
+            eq_(sorted(stats_sum), hostnames[k])
+            eq_(sorted(x['stdout'] for x in outputs.values()), hostnames[k])
+
+    def test_run_in_batches(self):
+        '''
+            the code of the first batch gone wrong is kept, not combined
+        '''
+        inventory = Mock()
+        inventory.get_hosts.return_value = ['h%d' % i for i in range(4)]
+        tqm = Mock()
+        tqm.run.side_effect = [0, 2, 1, 3]
+        eq_(runInBatches(tqm, inventory, Mock(), serial=1), 2)
+        eq_(tqm.run.call_count, 4)
+        eq_(inventory.restrict_to_hosts.call_args[0][0], ['h3'])
+        ok_(inventory.remove_restriction.called)
+        tqm.run.side_effect = [0, 0]
+        eq_(runInBatches(tqm, inventory, Mock(), serial=2), 0)
+
+    def test_clean_scripts(self):
+        '''
+            scripts used again while being cleaned up are kept
+        '''
+        cache_dir = tempfile.mkdtemp()
+        try:
+            [old, used] = [scriptFile(x, cache_dir) for x in ('old', 'used')]
+            past = time.time() - 120
+            for path in (old, used):
+                os.utime(path, (past, past))
+            stat = os.stat
+
+            # the script is marked used right after its first look
+            def look(path):
+                result = stat(path)
+                if path == used:
+                    os.utime(path, None)
+                return result
+            with patch('promise.ansiAdapter.ansiAdapter.os.stat',
+                       side_effect=look):
+                AnsibleRuntime().cleanScripts(cache_dir, 60)
+            eq_(os.listdir(cache_dir), [os.path.basename(used)])
+        finally:
+            shutil.rmtree(cache_dir)
+
+    def test_connection_vars(self):
+        '''
+            master connections of walkers are not overridden by ssh_args
+        '''
+        runtime = AnsibleRuntime()
+        eq_(runtime.connectionVars(), {})
+        eq_(runtime.connectionVars(pipelining=True),
+            {'ansible_ssh_pipelining': True})
+        control_dir = tempfile.mkdtemp()
+        ssh_args = PlayContext._ssh_args.default
+        PlayContext._ssh_args.default = (
+            '-C -o ControlMaster=auto -oControlPersist=60s '
+            '-o "ProxyCommand=ssh -W %h:%p jump"')
+        try:
+            variables = runtime.connectionVars('/key', control_dir, 300)
+            args = variables['ansible_ssh_common_args']
+            ok_('ControlPersist=300s' in args)
+            ok_(args.startswith('-o ControlMaster=auto'))
+            eq_(PlayContext().ssh_args,
+                "-C -o 'ProxyCommand=ssh -W %h:%p jump'")
+        finally:
+            PlayContext._ssh_args.default = ssh_args
+            shutil.rmtree(control_dir)
@@ -165,11 +165,31 @@ class TestInterfaces():
         """
         ip_list = ['127.0.0.1', '127.0.0.2', '127.0.0.3']
         result = None
-        passwords = Mock(return_value='111111')
+        passwords = Mock(
+            side_effect=lambda key, texts: ['111111'] * len(texts))
         # eq_(passwords.return_value, '111111')
-        with patch('promise.eater.interfaces.decrypt', passwords):
+        with patch('promise.eater.interfaces.decrypt_many', passwords):
             from promise.eater.interfaces import to_forward
             result = to_forward(ip_list)
         # eq_(result, None)
         eq_(result[0]['model'], 'n7010')
         eq_(result[0]['actpass'], '111111')
+
+    @with_setup(setUp, tearDown)
+    def test_interface_to_forward_batch(self):
+        """
+            to forward for a list of ips at once
+        """
+        ip_list = ['127.0.0.3', '8.8.8.8', '127.0.0.1', '127.0.0.3']
+        passwords = Mock(
+            side_effect=lambda key, texts: ['111111'] * len(texts))
+        with patch('promise.eater.interfaces.decrypt_many', passwords):
+            from promise.eater.interfaces import to_forward
+            result = to_forward(ip_list)
+        # unknown ip is skipped and the order is kept
+        eq_([x['ip'] for x in result], ['127.0.0.3', '127.0.0.1', '127.0.0.3'])
+        eq_(result[0], result[2])
+        eq_(sorted(result[1].keys()), [
+            'actpass', 'connect', 'conpass', 'ip', 'model', 'remote_port',
+            'remote_user', 'vender'])
+        eq_(result[1]['remote_user'], app.config['FORWARD_USERNAME'])
@@ -13,12 +13,47 @@ sys.path.append('.')
 from nose.tools import *
 import json
 import os
+from mock import patch
 
 from sqlite3 import dbapi2 as sqlite3
 
 from promise import app, db
 from promise.eater.models import *
 
+
+# the serializer of an object walking its relationships one by one,
+# which to_dicts has to agree with
+def serialize(obj, count=0, depth=1, option=None, ignore=None):
+    columns = obj.columns().keys()
+    relationships = obj.relationships().keys()
+    if ignore:
+        columns = [x for x in columns if x not in ignore]
+    if option:
+        columns = [x for x in columns if x in option]
+        relationships = [x for x in relationships if x in option]
+    d = {k: getattr(obj, k) for k in columns}
+    depth = 3 if depth > 3 else depth
+    if not relationships or count == depth:
+        return d
+    count += 1
+    for k in relationships:
+        relation = getattr(obj, k)
+        if not relation:
+            d[k] = []
+        elif hasattr(relation, '__iter__'):
+            d[k] = [serialize(x, count, depth, option, ignore)
+                    for x in relation if isinstance(x, Doraemon)]
+        elif isinstance(relation, Doraemon):
+            d[k] = [serialize(relation, count, depth, option, ignore)]
+    return d
+
+
+# relationships come in no particular order, sort them by id to compare
+def ordered(d):
+    return dict((k, sorted([ordered(x) for x in w], key=lambda x: x['id'])
+                 if isinstance(w, list) else w) for k, w in d.items())
+
+
 class TestModels():
     '''
         Unit test for models in Eater
@@ -508,3 +543,92 @@ class TestModels():
         db.session.commit()
         y = Computer.query.filter_by(id=it1['id']).first()
         eq_(y.label, x.label)
+
+    # batched serialization test
+    @with_setup(setUp, tearDown)
+    def test_to_dicts(self):
+        '''
+        test batched serialization for eater
+        '''
+        it_list = ITEquipment.query.order_by(ITEquipment.id).all()
+        # 1. same output as serializing one by one
+        d = Doraemon.to_dicts(it_list, depth=2)
+        eq_(len(d), len(it_list))
+        for x, y in zip(it_list, d):
+            eq_(y['id'], x.id)
+            eq_(ordered(y), ordered(serialize(x, depth=2)))
+        # 2. relationships of the whole list
+        pm = d[[x.id for x in it_list].index('pm-1')]
+        eq_([x['id'] for x in pm['ip']], ['ip-1'])
+        eq_([x['id'] for x in pm['group']], ['gp-1'])
+        eq_(sorted([x['id'] for x in pm['osuser']]), ['u-1', 'u-3'])
+        eq_([x['id'] for x in pm['rack']], ['rack-1'])
+        # 3. option and ignore
+        d = Doraemon.to_dicts(
+            it_list, depth=2, option=('id', 'ip', 'ip_addr'),
+            ignore=('ip_addr', ))
+        eq_(sorted(d[0].keys()), ['id', 'ip'])
+        for x, y in zip(it_list, d):
+            eq_(ordered(y), ordered(serialize(
+                x, depth=2, option=('id', 'ip', 'ip_addr'),
+                ignore=('ip_addr', ))))
+        for x in d:
+            for y in x['ip']:
+                eq_(y.keys(), ['id'])
+        # 4. nothing to output
+        eq_(Doraemon.to_dicts([]), [])
+
+    # bulk upsert test
+    @with_setup(setUp, tearDown)
+    def test_bulk_upsert(self):
+        '''
+        test bulk insert and update for eater
+        '''
+        # 1. insert and update with many-to-many relationships
+        ret = ITEquipment().bulk_upsert(
+            [dict(id='pm-1', label='NFJD-PM-0001', group=['gp-2']),
+             dict(id='it-0001', label='NFJD-IT-0001', name='host-it-0001',
+                  group=['gp-1', 'gp-3'])],
+            defaults=dict(osuser=['u-1']))
+        eq_(ret, {'inserted': ['it-0001'], 'updated': ['pm-1'],
+                  'failed': []})
+        x = ITEquipment.query.filter_by(id='pm-1').first()
+        eq_(x.label, 'NFJD-PM-0001')
+        eq_(x.name, 'host-pm-1')
+        eq_(x.category, 'PhysicalMachine')
+        eq_([y.id for y in x.group], ['gp-2'])
+        eq_(sorted([y.id for y in x.osuser]), ['u-1', 'u-3'])
+        x = ITEquipment.query.filter_by(id='it-0001').first()
+        eq_(x.category, 'ITEquipment')
+        eq_(sorted([y.id for y in x.group]), ['gp-1', 'gp-3'])
+        eq_([y.id for y in x.osuser], ['u-1'])
+        # 2. an ITEquipment turns into a Network
+        ret = Network().bulk_upsert(
+            [dict(id='it-0001', enable_pass='666666')], chunk=1)
+        eq_(ret['updated'], ['it-0001'])
+        x = Network.query.filter_by(id='it-0001').first()
+        eq_(x.enable_pass, '666666')
+        eq_(x.category, 'Network')
+        # 3. find out existing records by another column
+        ret = Group().bulk_upsert(
+            [dict(name='elk', it=['pm-1']), dict(name='tomcat')],
+            key='name')
+        eq_(ret['updated'], ['gp-3'])
+        eq_(len(ret['inserted']), 1)
+        x = Group.query.filter_by(id='gp-3').first()
+        eq_([y.id for y in x.it], ['pm-1'])
+        eq_(Group.query.filter_by(name='tomcat').count(), 1)
+        # 4. a chunk failed to be prepared does not stop the others
+        prepare = Group._prepare
+        calls = []
+
+        def broken(self, *args):
+            calls.append(1)
+            if len(calls) == 1:
+                raise Exception('gone away')
+            return prepare(self, *args)
+        with patch.object(Group, '_prepare', broken):
+            ret = Group().bulk_upsert(
+                [dict(id='gp-4', name='redis'), dict(id='gp-5', name='kafka')],
+                chunk=1)
+        eq_(ret, {'inserted': ['gp-5'], 'updated': [], 'failed': ['gp-4']})
@@ -317,6 +317,87 @@ class TestServices():
         eq_(ret['totalpage'], False)
         eq_(response.status_code, 200)
 
+        # 4. cursor paging
+        # 4.1 first page
+        d = dict(limit=2, estimate=True)
+        response = self.tester.get(
+            '/api/v0.0/eater/hostgroup',
+            content_type='application/json',
+            headers={'token': self.token},
+            data=json.dumps(d))
+        ret = json.loads(response.data)
+        eq_(response.status_code, 200)
+        eq_([x['id'] for x in ret['data']], ['gp-1', 'gp-2'])
+        eq_(ret['after'], 'gp-2')
+        # a whole-table estimate, by statistics of mysql
+        total = ret['estimated_total']
+        ok_(isinstance(total, (int, long)) and total >= 0)
+        # 4.2 following page
+        d = dict(limit=2, after=ret['after'])
+        response = self.tester.get(
+            '/api/v0.0/eater/hostgroup',
+            content_type='application/json',
+            headers={'token': self.token},
+            data=json.dumps(d))
+        ret = json.loads(response.data)
+        eq_(response.status_code, 200)
+        eq_([x['id'] for x in ret['data']], ['gp-3'])
+        eq_(ret['after'], None)
+        assert 'estimated_total' not in ret
+        # 4.3 the cursor follows ids, it can not be sorted
+        d = dict(limit=2, sort='-name')
+        response = self.tester.get(
+            '/api/v0.0/eater/hostgroup',
+            content_type='application/json',
+            headers={'token': self.token},
+            data=json.dumps(d))
+        eq_(response.status_code, 400)
+
+
+    @with_setup(setUp, tearDown)
+    def test_ip_list_api_filter(self):
+        """
+            get ip list from eater with filters, sorting and count
+        """
+        def get(**d):
+            response = self.tester.get(
+                '/api/v0.0/eater/ip',
+                content_type='application/json',
+                headers={'token': self.token},
+                data=json.dumps(d))
+            return response.status_code, json.loads(response.data)
+        # 1. in-list
+        code, ret = get(ip_category_in=['vm', 'vip'])
+        eq_(code, 200)
+        eq_(len(ret['data']), 6)
+        # 2. prefix
+        code, ret = get(ip_addr_prefix='172.16.220.')
+        eq_(sorted(x['id'] for x in ret['data']), ['ip-1', 'ip-2', 'ip-3'])
+        # 3. cidr
+        code, ret = get(cidr='172.16.222.0/24')
+        eq_(len(ret['data']), 6)
+        code, ret = get(cidr='172.16.220.2/31')
+        eq_(sorted(x['id'] for x in ret['data']), ['ip-2', 'ip-3'])
+        code, ret = get(cidr='172.16.222.128/25')
+        eq_(sorted(x['id'] for x in ret['data']), ['ip-10', 'ip-9'])
+        code, ret = get(cidr='172.16.0.0/12')
+        eq_(len(ret['data']), 10)
+        code, ret = get(cidr='172.16.0.0/33')
+        eq_(code, 400)
+        # 4. time range
+        code, ret = get(since='2000-01-01T00:00:00', until='2000-01-02T00:00:00')
+        eq_(ret['data'], [])
+        # 5. sort and paging
+        code, ret = get(sort='-ip_addr', ip_category='vm', page=1, pp=3)
+        eq_([x['ip_addr'] for x in ret['data']],
+            ['172.16.222.7', '172.16.222.6', '172.16.222.5'])
+        eq_(ret['totalpage'], 2)
+        code, ret = get(sort='-nothing')
+        eq_(code, 400)
+        # 6. count only
+        code, ret = get(count=True, vlan_id_in=['vlan-1', 'vlan-2'])
+        eq_(code, 200)
+        eq_(ret, {'total': 4})
 
     @with_setup(setUp, tearDown)
     def test_hostgroup_api(self):
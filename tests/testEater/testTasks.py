@@ -19,6 +19,7 @@ from promise import app, db, utils
 from promise.user import utils as userUtils
 from promise.user.models import *
 from promise.eater.tasks import *
+from promise.eater.tasks import _sync
 
 
 class TestTasks():
@@ -94,3 +95,18 @@ class TestTasks():
                 'Doraemon Update Notify: Network Infos are Up-to-the-Minute.')
         except MySQLdb.Error:
             pass
+
+    @with_setup(setUp, tearDown)
+    def test_incremental_sync(self):
+        """
+            only changed objects are written while synchronizing
+        """
+        rows = [dict(id='gp-1', name='ansible'), dict(id='gp-2', name='elk')]
+        eq_(_sync(Group, rows), {'added': 2, 'changed': 0, 'removed': 0})
+        eq_(_sync(Group, rows), {'added': 0, 'changed': 0, 'removed': 0})
+        rows = [dict(id='gp-1', name='zabbix')]
+        eq_(_sync(Group, rows), {'added': 0, 'changed': 1, 'removed': 1})
+        eq_(Group.query.filter_by(id='gp-1').first().name, 'zabbix')
+        eq_(Group.query.count(), 2)
+        eq_(_sync(Group, rows, incremental=False),
+            {'added': 0, 'changed': 1, 'removed': 0})
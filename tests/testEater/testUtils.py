@@ -0,0 +1,87 @@
+# -*- coding:utf-8 -*-
+# !/usr/bin/env python
+#
+# Author: Leann Mak
+# Email: leannmak@139.com
+# Date: Aug 1, 2016
+#
+# This is autotest for utility module of eater package.
+
+import sys
+sys.path.append('.')
+
+from nose.tools import *
+import os
+import shutil
+import tempfile
+import rsa
+from mock import patch
+
+from promise import app
+from promise.eater.utils import encrypt, decrypt, decrypt_many
+
+
+class TestUtils():
+    '''
+        Unit test for utils in Eater
+    '''
+    # generate a pair of rsa keys
+    def setUp(self):
+        app.testing = True
+        self.folder = tempfile.mkdtemp()
+        self.publickey = os.path.join(self.folder, 'public_rsa')
+        self.privatekey = os.path.join(self.folder, 'private_rsa')
+        (pub, pri) = rsa.newkeys(512)
+        with open(self.publickey, 'w') as f:
+            f.write(pub.save_pkcs1())
+        with open(self.privatekey, 'w') as f:
+            f.write(pri.save_pkcs1())
+        self.cache_size = app.config['EATER_DECRYPT_CACHE_SIZE']
+
+    # drop keys
+    def tearDown(self):
+        app.config['EATER_DECRYPT_CACHE_SIZE'] = self.cache_size
+        shutil.rmtree(self.folder)
+
+    @with_setup(setUp, tearDown)
+    def test_decrypt(self):
+        '''
+            the private key is parsed only once
+        '''
+        ciphertext = encrypt(self.publickey, '111111')
+        with patch('rsa.PrivateKey.load_pkcs1',
+                   wraps=rsa.PrivateKey.load_pkcs1) as load:
+            eq_(decrypt(self.privatekey, ciphertext), '111111')
+            eq_(decrypt(self.privatekey, ciphertext), '111111')
+            eq_(load.call_count, 1)
+
+    @with_setup(setUp, tearDown)
+    def test_decrypt_cache(self):
+        '''
+            decrypted passwords are kept in memory
+        '''
+        app.config['EATER_DECRYPT_CACHE_SIZE'] = 1
+        ciphertext = encrypt(self.publickey, '111111')
+        with patch('rsa.decrypt', wraps=rsa.decrypt) as dec:
+            eq_(decrypt(self.privatekey, ciphertext), '111111')
+            eq_(decrypt(self.privatekey, ciphertext), '111111')
+            eq_(dec.call_count, 1)
+
+    @with_setup(setUp, tearDown)
+    def test_decrypt_many(self):
+        '''
+            decrypt a list of passwords
+        '''
+        ciphertexts = [encrypt(self.publickey, x) for x in ('a', 'b')]
+        ciphertexts.append(ciphertexts[0])
+        with patch('rsa.decrypt', wraps=rsa.decrypt) as dec:
+            eq_(decrypt_many(self.privatekey, ciphertexts), ['a', 'b', 'a'])
+            eq_(dec.call_count, 2)
+
+    @with_setup(setUp, tearDown)
+    def test_decrypt_many_broken(self):
+        '''
+            a missing or broken password does not fail the others
+        '''
+        ciphertexts = [encrypt(self.publickey, 'a'), None, 'broken']
+        eq_(decrypt_many(self.privatekey, ciphertexts), ['a', '', ''])
@@ -20,6 +20,7 @@ from sqlite3 import dbapi2 as sqlite3
 from promise import app, db, utils
 from promise.user import utils as userUtils
 from promise.user.models import *
+from promise.user import auth
 from tests import utils as testUtils
 #from promise.user import *
 
@@ -166,3 +167,48 @@ class TestApiToken():
         assert 'token tampered' in rv.data
         eq_(rv.status_code, 400)#
 
+    @with_setup(setUp, tearDown)
+    def test_user_methodPrivelege_token_not_ascii(self):
+        """
+        test token with non-ascii characters to access one method
+        """
+        [user_id, priv_name_list, msg] = auth.AuthMethods.tokenAuth(
+            u'\u4e2d\u6587.token')
+        eq_(user_id, None)
+        rv = self.app.get(
+            '/api/v0.0/user/token',
+            headers = {'token': u'caf\xe9'},
+            follow_redirects = True)
+        eq_(rv.status_code, 400)
+
+    @with_setup(setUp, tearDown)
+    def test_user_methodPrivelege_cached(self):
+        """
+        test verified token and valid user cached, and the cached user
+        dropped once the user is set invalid
+        """
+        [token, refreshtoken] = testUtils.getUserToken(
+            self.app,
+            app.config['DEFAULT_ROOT_USERNAME'],
+            app.config['DEFAULT_ROOT_PASSWORD'])
+        for i in range(2):
+            rv = self.app.get(
+                '/api/v0.0/user/user',
+                headers = {'token': token},
+                follow_redirects = True)
+            assert 'user_list' in rv.data
+            eq_(rv.status_code, 200)
+        [user_id, priv_name_list, msg] = auth.AuthMethods.tokenAuth(token)
+        assert 'cached token' in msg
+        assert valid_users.get(user_id)
+        # delete the user
+        user = User.getValidUser(user_id=user_id)
+        user.setInvalid()
+        user.save()
+        assert not valid_users.get(user_id)
+        rv = self.app.get(
+            '/api/v0.0/user/user',
+            headers = {'token': token},
+            follow_redirects = True)
+        assert 'cannot find user' in rv.data
+        eq_(rv.status_code, 400)
@@ -116,3 +116,34 @@ class TestApiUserList():
         print rv.data
         assert 'updated' in rv.data
         eq_(rv.status_code, 200)
+
+    @with_setup(setUp, tearDown)
+    def test_user_api_get_user_list(self):
+        """
+        test get user list, roles and privileges of users resolved at once
+        and cached until a role is saved
+        """
+        [token, refreshtoken] = testUtils.getUserToken(
+            self.app, 'mike', 'mikepass')
+        rv = self.app.get(
+            '/api/v0.0/user/user',
+            headers = {'token': token},
+            follow_redirects = True)
+        eq_(rv.status_code, 200)
+        user_list = json.loads(rv.data)['user_list']
+        tom = [x for x in user_list if x['username'] == 'tom'][0]
+        eq_([x['name'] for x in tom['role']], ['operator'])
+        eq_(sorted(x['name'] for x in tom['privilege']),
+            ['scriptExec', 'shellExec', 'walkerInfo'])
+        visitor = [x for x in user_list if x['username'] == 'visitor'][0]
+        eq_(visitor['role'], [])
+        eq_(visitor['privilege'], [])
+        assert user_privileges.get(tom['user_id'])
+
+        # a role updated
+        role = Role.getValidRole(role_name='operator')
+        role.update(privileges=[
+            Privilege.getValidPrivilege(privilege_name='walkerInfo')])
+        role.save()
+        user = User.getValidUser(username='tom')
+        eq_(user.getPrivilegeNameList(), ['walkerInfo'])
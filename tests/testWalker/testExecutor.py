@@ -0,0 +1,60 @@
+# -*- coding:utf-8 -*-
+# !/usr/bin/env python
+#
+# Author: Shawn.T
+# Email: shawntai.ds@gmail.com
+#
+# This is autotest for the executor module of walker package.
+
+import sys
+sys.path.append('.')
+
+from nose.tools import *
+
+from promise import app, db
+from promise.walker.models import Walker
+from promise.walker.executor import scheduler, WalkerScheduler
+
+
+class TestExecutor():
+    '''
+        Unit test for the walker scheduler
+    '''
+    # establish db
+    def setUp(self):
+        app.testing = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = \
+            'mysql://root@localhost:3306/test'
+        db.create_all()
+
+    # drop db
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+
+    @with_setup(setUp, tearDown)
+    def test_recover(self):
+        '''
+            walkers queued or running by the last run are marked faild
+        '''
+        for state in (-2, -1, 0):
+            walker = Walker('walker%d' % state)
+            walker.state = state
+            walker.save()
+        scheduler.recover()
+        eq_(sorted(x.state for x in Walker.query), [-4, -4, 0])
+
+    def test_priority_fairness(self):
+        '''
+            a high priority does not let a user skip the fairness
+        '''
+        s = WalkerScheduler(1)
+        s.running['tom'] = 1
+        s.waiting['tom'] = [(-999999, 0, 'w-tom', None, ())]
+        s.waiting['jerry'] = [(0, 1, 'w-jerry', None, ())]
+        eq_(s.next()[:2], ['jerry', 'w-jerry'])
+        # priority still ranks the missions of users running as many
+        s = WalkerScheduler(1)
+        s.waiting['tom'] = [(-1, 1, 'w-tom', None, ())]
+        s.waiting['jerry'] = [(0, 0, 'w-jerry', None, ())]
+        eq_(s.next()[:2], ['tom', 'w-tom'])
@@ -0,0 +1,159 @@
+# -*- coding:utf-8 -*-
+# !/usr/bin/env python
+#
+# Author: Shawn.T
+# Email: shawntai.ds@gmail.com
+#
+# This is autotest for the model module of walker package.
+
+import sys
+sys.path.append('.')
+
+from nose.tools import *
+import zlib
+from mock import patch
+
+from promise import app, db
+from promise.walker.models import Walker, ShellMission, ForwardMission, \
+    Script, Trail, TrailWriter, Output
+
+
+class Owner(object):
+    user_id = 'tom'
+
+
+class TestModels():
+    '''
+        Unit test for the walker models
+    '''
+    # establish db
+    def setUp(self):
+        app.testing = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = \
+            'mysql://root@localhost:3306/test'
+        db.create_all()
+        self.ips = ['10.0.0.%d' % i for i in range(5)]
+        walker = Walker('walker')
+        walker.establish(
+            self.ips, Owner(), ShellMission('uptime', 'root', walker))
+        self.walker_id = walker.walker_id
+        self.stat_sum = dict(
+            ok=1, failures=0, unreachable=0, skipped=0, changed=0)
+        self.summary = app.config['WALKER_OUTPUT_SUMMARY']
+        app.config['WALKER_OUTPUT_SUMMARY'] = 4
+
+    # drop db
+    def tearDown(self):
+        app.config['WALKER_OUTPUT_SUMMARY'] = self.summary
+        db.session.remove()
+        db.drop_all()
+
+    def write(self, writer):
+        for ip in self.ips:
+            writer.add(ip, self.stat_sum, {'stdout': 'o' + ip})
+
+    @with_setup(setUp, tearDown)
+    def test_trail_writer(self):
+        '''
+            results failed to be written are kept and written later
+        '''
+        writer = TrailWriter(Walker.query.get(self.walker_id), chunk=2)
+        with patch('promise.walker.models.Output.store',
+                   side_effect=Exception('gone away')) as store:
+            self.write(writer)
+        # tried once more after reconnecting, then once another chunk came
+        eq_(store.call_count, 4)
+        eq_(len(writer.rows), 5)
+        eq_(writer.close(0)[0], True)
+        db.session.remove()
+        eq_(Walker.query.get(self.walker_id).state, 0)
+        eq_(sorted(''.join(x.readOutput()) for x in Trail.query),
+            ['o' + x for x in self.ips])
+
+    @with_setup(setUp, tearDown)
+    def test_trail_writer_failed(self):
+        '''
+            the walker is marked faild if its trails can not be written
+        '''
+        writer = TrailWriter(Walker.query.get(self.walker_id), chunk=2)
+        with patch('promise.walker.models.Output.store',
+                   side_effect=Exception('gone away')):
+            self.write(writer)
+            eq_(writer.close(0)[0], False)
+        db.session.remove()
+        eq_(Walker.query.get(self.walker_id).state, -4)
+
+    def test_output_pack(self):
+        '''
+            outputs longer than the summary go to the blobs once
+        '''
+        blobs = {}
+        eq_(Output.pack(None, blobs), [None, None, None])
+        eq_(Output.pack(u'\u4e2d\u6587', blobs), [u'\u4e2d\u6587', 6, None])
+        eq_(blobs, {})
+        [summary, length, digest] = Output.pack('hello world', blobs)
+        eq_([summary, length], [u'hell', 11])
+        Output.pack(u'hello world', blobs)
+        eq_(blobs.keys(), [digest])
+        eq_(blobs[digest][0], 11)
+        eq_(zlib.decompress(blobs[digest][1]), 'hello world')
+
+    def test_output_iterate(self):
+        '''
+            outputs are decompressed piece by piece within the range
+        '''
+        raw = ''.join('line %d\n' % i for i in range(1000))
+        data = zlib.compress(raw)
+        pieces = list(Output.iterate(data, size=1024))
+        ok_(len(pieces) > 1)
+        ok_(max(len(x) for x in pieces) <= 1024)
+        eq_(''.join(pieces), raw)
+        eq_(''.join(Output.iterate(data, 1000, 3000, size=1024)),
+            raw[1000:4000])
+        eq_(''.join(Output.iterate(data, 5000, size=1024)), raw[5000:])
+        eq_(list(Output.iterate(data, len(raw), size=1024)), [])
+
+    @with_setup(setUp, tearDown)
+    def test_output_store(self):
+        '''
+            an output shared by many is stored once and read by all of them
+        '''
+        trails = Trail.query.all()
+        for trail in trails:
+            trail.resultUpdate(self.stat_sum, {'stdout': 'same output'})
+            trail.save()
+        # stored already
+        blobs = {}
+        Output.pack('same output', blobs)
+        Output.store(blobs)
+        db.session.commit()
+        eq_(Output.query.count(), 1)
+        trail = Trail.query.get(trails[0].trail_id)
+        eq_([trail.stdout, trail.stdout_length], [u'same', 11])
+        eq_(''.join(trail.readOutput()), 'same output')
+        eq_(''.join(trail.readOutput(offset=5, limit=3)), 'out')
+        eq_(list(trail.readOutput('stderr')), [])
+
+    @with_setup(setUp, tearDown)
+    def test_forward_mission_output(self):
+        '''
+            the whole stdout of a forward mission is read from the store
+        '''
+        walker = Walker('forward')
+        script = Script('script', 'show version', Owner(), 'shell', False)
+        mission = ForwardMission(script, 'root', '', walker)
+        walker.establish(['10.0.1.1'], Owner(), mission)
+        writer = TrailWriter(walker)
+        [summary, length, digest] = writer.pack('show version output')
+        writer.update(mission, stdout=summary, stdout_length=length,
+                      stdout_digest=digest)
+        eq_(writer.close(0)[0], True)
+        mission = ForwardMission.getFromIdWithinUser(
+            mission.forwardmission_id, Owner())
+        eq_(mission.stdout, u'show')
+        eq_(''.join(mission.readOutput(offset=5)), 'version output')
+
+        class Other(object):
+            user_id = 'jerry'
+        eq_(ForwardMission.getFromIdWithinUser(
+            mission.forwardmission_id, Other()), None)
@@ -0,0 +1,184 @@
+# -*- coding:utf-8 -*-
+# !/usr/bin/env python
+#
+# Author: Shawn.T
+# Email: shawntai.ds@gmail.com
+#
+# This is autotest for the trail output API of walker package.
+
+import sys
+sys.path.append('.')
+
+from nose.tools import *
+
+from promise import app, db
+from promise.user.models import User
+from promise.walker.models import Walker, ShellMission, ForwardMission, \
+    Script, Trail, TrailWriter
+from promise.walker.walker import TrailOutputAPI
+from tests import utils as testUtils
+
+
+class TestTrailOutputAPI():
+    '''
+        Unit test for API: TrailOutput
+    '''
+    # establish db with the trails of jerry, who is not allowed to exec
+    def setUp(self):
+        app.testing = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = \
+            'mysql://root@localhost:3306/test'
+        self.summary = app.config['WALKER_OUTPUT_SUMMARY']
+        app.config['WALKER_OUTPUT_SUMMARY'] = 16
+        self.tester = app.test_client(self)
+        db.create_all()
+        testUtils.importUserData()
+        [self.token, refreshtoken] = testUtils.getUserToken(
+            self.tester, 'jerry', 'jerrypass')
+        owner = User.query.filter_by(username='jerry').first()
+        walker = Walker('walker')
+        walker.establish(
+            ['10.0.0.1', '10.0.0.2'], owner,
+            ShellMission('cat log', 'root', walker))
+        self.stdout = ''.join('line %d\r\n' % i for i in range(100))
+        stat_sum = dict(ok=1, failures=0, unreachable=0, skipped=0, changed=0)
+        writer = TrailWriter(walker)
+        writer.add('10.0.0.1', stat_sum, {'stdout': self.stdout})
+        writer.close(0)
+        self.trail_id = Trail.query.filter_by(ip='10.0.0.1').one().trail_id
+        # a trail written before the output store, with no length
+        trail = Trail.query.filter_by(ip='10.0.0.2').one()
+        trail.stdout = u'中文 legacy'
+        trail.save()
+        self.legacy_id = trail.trail_id
+
+    # drop db
+    def tearDown(self):
+        app.config['WALKER_OUTPUT_SUMMARY'] = self.summary
+        db.session.remove()
+        db.drop_all()
+
+    def get(self, headers=None, **args):
+        headers = dict(headers or {}, token=self.token)
+        return self.tester.get(
+            '/api/v0.0/trailoutput', query_string=args, headers=headers)
+
+    def test_events(self):
+        '''
+            whole lines go by events, ids are the offsets following them
+        '''
+        events = list(TrailOutputAPI.events(['a\nb', 'c\r\nd'], 10))
+        eq_(events, [
+            'id: 12\ndata: a\n\n',
+            'id: 16\ndata: bc\n\n',
+            'id: 17\ndata: d\n\n',
+            'event: end\ndata: 17\n\n'])
+        eq_(list(TrailOutputAPI.events([], 5)), ['event: end\ndata: 5\n\n'])
+
+    @with_setup(setUp, tearDown)
+    def test_get_output(self):
+        '''
+            the whole output, or a part of it by offset and limit
+        '''
+        response = self.get(trailid=self.trail_id)
+        eq_(response.status_code, 200)
+        eq_(response.data, self.stdout)
+        eq_(response.headers['Accept-Ranges'], 'bytes')
+        assert 'Content-Range' not in response.headers
+        response = self.get(trailid=self.trail_id, offset=8, limit=8)
+        eq_(response.status_code, 206)
+        eq_(response.data, self.stdout[8:16])
+        eq_(response.headers['Content-Range'],
+            'bytes 8-15/%d' % len(self.stdout))
+        response = self.get(trailid=self.trail_id, output='stderr')
+        eq_(response.status_code, 200)
+        eq_(response.data, '')
+
+    @with_setup(setUp, tearDown)
+    def test_get_output_range(self):
+        '''
+            a part of the output by the Range header
+        '''
+        length = len(self.stdout)
+        response = self.get({'Range': 'bytes=-10'}, trailid=self.trail_id)
+        eq_(response.status_code, 206)
+        eq_(response.data, self.stdout[-10:])
+        eq_(response.headers['Content-Range'],
+            'bytes %d-%d/%d' % (length - 10, length - 1, length))
+        response = self.get({'Range': 'bytes=100-'}, trailid=self.trail_id)
+        eq_(response.data, self.stdout[100:])
+        eq_(response.headers['Content-Length'], str(length - 100))
+        response = self.get(
+            {'Range': 'bytes=%d-' % length}, trailid=self.trail_id)
+        eq_(response.status_code, 416)
+
+    @with_setup(setUp, tearDown)
+    def test_get_legacy_output(self):
+        '''
+            outputs of trails written before the output store
+        '''
+        raw = u'中文 legacy'.encode('utf-8')
+        response = self.get(trailid=self.legacy_id)
+        eq_(response.data, raw)
+        eq_(response.headers['Content-Length'], str(len(raw)))
+        response = self.get({'Range': 'bytes=-6'}, trailid=self.legacy_id)
+        eq_(response.status_code, 206)
+        eq_(response.data, 'legacy')
+        eq_(response.headers['Content-Range'],
+            'bytes %d-%d/%d' % (len(raw) - 6, len(raw) - 1, len(raw)))
+
+    @with_setup(setUp, tearDown)
+    def test_stream_output(self):
+        '''
+            the output streamed as events, resumed by Last-Event-ID
+        '''
+        response = self.get(trailid=self.trail_id, stream=True)
+        eq_(response.status_code, 200)
+        eq_(response.mimetype, 'text/event-stream')
+        lines = [x[6:] for x in response.data.split('\n')
+                 if x.startswith('data: ')]
+        eq_(lines[:-1], ['line %d' % i for i in range(100)])
+        eq_(lines[-1], str(len(self.stdout)))
+        offset = self.stdout.index('line 98')
+        response = self.get(
+            {'Last-Event-ID': str(offset)}, trailid=self.trail_id,
+            stream=True)
+        eq_(response.data, 'id: %d\ndata: line 98\ndata: line 99\n\n'
+            'event: end\ndata: %d\n\n' % ((len(self.stdout), ) * 2))
+
+    @with_setup(setUp, tearDown)
+    def test_get_forward_output(self):
+        '''
+            the stdout of a forward mission
+        '''
+        owner = User.query.filter_by(username='jerry').first()
+        walker = Walker('forward')
+        script = Script('script', 'show version', owner, 'shell', False)
+        mission = ForwardMission(script, 'root', '', walker)
+        walker.establish(['10.0.1.1'], owner, mission)
+        writer = TrailWriter(walker)
+        [summary, length, digest] = writer.pack(self.stdout)
+        writer.update(mission, stdout=summary, stdout_length=length,
+                      stdout_digest=digest)
+        writer.close(0)
+        response = self.get(forwardmissionid=mission.forwardmission_id)
+        eq_(response.status_code, 200)
+        eq_(response.data, self.stdout)
+        response = self.get(
+            forwardmissionid=mission.forwardmission_id, output='stderr')
+        eq_(response.status_code, 400)
+        response = self.get(
+            trailid=self.trail_id,
+            forwardmissionid=mission.forwardmission_id)
+        eq_(response.status_code, 400)
+
+    @with_setup(setUp, tearDown)
+    def test_get_output_of_others(self):
+        '''
+            outputs of walkers owned by others are not found
+        '''
+        [self.token, refreshtoken] = testUtils.getUserToken(
+            self.tester, 'tom', 'tompass')
+        response = self.get(trailid=self.trail_id)
+        eq_(response.status_code, 400)
+        assert 'wrong trail id' in response.data
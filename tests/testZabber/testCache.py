@@ -0,0 +1,120 @@
+# -*- coding:utf-8 -*-
+# !/usr/bin/env python
+#
+# This is autotest for the cache used by zabber list apis.
+
+import sys
+sys.path.append('.')
+
+from nose.tools import *
+import threading
+from mock import patch
+
+from promise import app
+from promise.utils import TTLCache
+
+
+class TestCache():
+    '''
+        Unit test for TTLCache
+    '''
+    def setUp(self):
+        app.testing = True
+        self.now = 1000.0
+        self.patcher = patch('promise.utils.time.time',
+                             side_effect=lambda: self.now)
+        self.patcher.start()
+        self.cache = TTLCache(2, 60)
+
+    def tearDown(self):
+        self.patcher.stop()
+
+    def loader(self, value):
+        calls = []
+
+        def load():
+            calls.append(value)
+            return value
+        return load, calls
+
+    @with_setup(setUp, tearDown)
+    def test_get(self):
+        '''
+            items expire after ttl and the least recently used is dropped
+        '''
+        self.cache.set('a', 1)
+        self.cache.set('b', 2)
+        eq_(self.cache.get('a'), 1)
+        self.cache.set('c', 3)
+        eq_(self.cache.get('b'), None)
+        eq_(self.cache.get('a'), 1)
+        self.now += 60
+        eq_(self.cache.get('a'), None)
+        eq_(self.cache.get('c', 0), 0)
+
+    @with_setup(setUp, tearDown)
+    def test_load(self):
+        '''
+            loader is called on a miss only
+        '''
+        load, calls = self.loader(1)
+        eq_(self.cache.load('a', load), 1)
+        eq_(self.cache.load('a', load), 1)
+        eq_(calls, [1])
+        self.now += 60
+        eq_(self.cache.load('a', load), 1)
+        eq_(calls, [1, 1])
+
+    @with_setup(setUp, tearDown)
+    def test_load_stale(self):
+        '''
+            an expired value is served for stale seconds at most
+        '''
+        load, calls = self.loader(1)
+        eq_(self.cache.load('a', load, stale=30), 1)
+        self.now += 70
+        refreshed = threading.Event()
+        with patch.object(self.cache, '_refresh',
+                          side_effect=lambda *a: refreshed.set()):
+            eq_(self.cache.load('a', lambda: 2, stale=30), 1)
+            ok_(refreshed.wait(5))
+        # still not refreshed, the value is too old to be served now
+        self.cache.loading.clear()
+        self.now += 30
+        eq_(self.cache.load('a', lambda: 2, stale=30), 2)
+
+    @with_setup(setUp, tearDown)
+    def test_load_failed(self):
+        '''
+            those waiting for a failed loader get its error
+        '''
+        started, release, waiting = [threading.Event() for _ in range(3)]
+        results = {}
+
+        def fail():
+            started.set()
+            release.wait(5)
+            raise ValueError('zabbix is down')
+
+        def run(name, loader):
+            try:
+                results[name] = self.cache.load('a', loader)
+            except ValueError, e:
+                results[name] = e
+        first = threading.Thread(target=run, args=('first', fail))
+        first.start()
+        ok_(started.wait(5))
+        event = self.cache.loading['a']
+        wait = event.wait
+        event.wait = lambda *a: (waiting.set(), wait(*a))[1]
+        load, calls = self.loader(1)
+        second = threading.Thread(target=run, args=('second', load))
+        second.start()
+        ok_(waiting.wait(5))
+        release.set()
+        first.join(5)
+        second.join(5)
+        ok_(isinstance(results['first'], ValueError))
+        ok_(results['second'] is results['first'])
+        eq_(calls, [])
+        eq_(self.cache.loading, {})